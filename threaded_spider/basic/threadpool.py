@@ -11,6 +11,7 @@ except ImportError:
 import contextlib
 import threading
 import copy
+import time
 
 from threaded_spider import logger
 from threaded_spider.basic import context, failure
@@ -59,6 +60,8 @@ class ThreadPool(object):
         self.threads = []
         self.working = []
         self.active_tasks = []
+        # Map the working threads to (start time, func, args) of their tasks.
+        self.task_started = {}
 
     def start(self):
         """
@@ -172,6 +175,7 @@ class ThreadPool(object):
             with self._workerState(self.working, ct):
                 ctx, function, args, kwargs, onResult = o
                 del o
+                self.task_started[ct] = (time.time(), function, args)
 
                 try:
                     result = context.call(ctx, function, *args, **kwargs)
@@ -191,6 +195,7 @@ class ThreadPool(object):
                     except:
                         context.call(ctx, logger.error)
                 
+                del self.task_started[ct]
             self.active_tasks.remove((function, args, kwargs))
             del function, args, kwargs
             del ctx, onResult, result
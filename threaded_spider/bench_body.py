@@ -0,0 +1,134 @@
+# -*- coding:utf-8 -*-
+"""Measure the peak memory and the throughput of a page body on its way from
+the socket through the Response, the spider and the item into sqlite, for
+the ways the downloaders could receive it."""
+
+from __future__ import with_statement
+
+import optparse
+import resource
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import sys
+import os
+
+# Temporarily declare the search path for the package.
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+pkg_path = os.path.join(CUR_DIR, '..')
+sys.path.insert(0, pkg_path)
+
+from threaded_spider.http import Request, Response
+from threaded_spider.core.bodyreceiver import BodyReceiver
+from threaded_spider.core.evdownloader import _ResponseParser
+
+# name -> (preallocate the body, receive into it)
+MODES = [
+    ('joined chunks', False, False),
+    ('preallocated, recv', True, False),
+    ('preallocated, recv_into', True, True),
+]
+
+def make_page(size):
+    body = '<html><body>%s</body></html>' % ('x' * size)
+    head = 'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: %d\r\n\r\n' % len(body)
+    return head + body
+
+def send_pages(sock, page, number):
+    for _ in xrange(number):
+        sock.sendall(page)
+        # One request at a time, as the downloaders don't pipeline.
+        sock.recv(1)
+    sock.close()
+
+def receive(sock, preallocate, recv_into, chunk_size):
+    """Receive a response like the event loop downloader."""
+    make_receiver = lambda status, headers: BodyReceiver(
+        'http://bench/', headers, preallocate_size=preallocate and 1 or 0)
+    parser = _ResponseParser(make_receiver)
+    while not parser.done:
+        view = recv_into and parser.writable(chunk_size)
+        if view:
+            size = sock.recv_into(view)
+            view = None
+            parser.received(size)
+        else:
+            parser.feed(sock.recv(chunk_size))
+    return parser
+
+def process(parser, db):
+    """Pass the body through a Response, the spider and the item pipeline."""
+    request = Request('http://bench/')
+    response = Response._from_trusted('http://bench/', status=parser.status,
+                                      headers=parser.headers,
+                                      body=parser.receiver.getvalue(), request=request)
+    body = response.body
+    assert body.find('</') != -1
+    item = {'self_url': response.url, 'html_content': body, 'depth': request.depth}
+    db.execute('insert into page (url, body) values (?, ?)',
+               (item['self_url'], buffer(item['html_content'])))
+    db.commit()
+    db.execute('delete from page')
+
+def run_mode(preallocate, recv_into, page, number, chunk_size):
+    """Return the (peak memory growth in KB, seconds) of receiving and
+    processing `number` pages."""
+    reader, writer = socket.socketpair()
+    # Large buffers as a network card would keep filling.
+    reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    with tempfile.NamedTemporaryFile(suffix='.db') as f:
+        db = sqlite3.connect(f.name)
+        db.execute('create table page (url text, body blob)')
+        base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t = threading.Thread(target=send_pages, args=(writer, page, number))
+        t.start()
+        start = time.time()
+        for _ in xrange(number):
+            process(receive(reader, preallocate, recv_into, chunk_size), db)
+            reader.sendall('.')
+        elapsed = time.time() - start
+        t.join()
+        db.close()
+    reader.close()
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base, elapsed
+
+def fork_run(*args):
+    """Run a mode in a child process, whose peak memory isn't raised by
+    the modes run before."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        os.write(wfd, repr(run_mode(*args)))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 1024)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return eval(result)
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-s', dest='size', default=4.0, type='float',
+                      help='Size of the page body in MB, %default by default.')
+    parser.add_option('-n', dest='number', default=20, type='int',
+                      help='Pages received for each way, %default by default.')
+    parser.add_option('-c', dest='chunk', default=64, type='int',
+                      help='Bytes read from the socket at a time in KB, %default by default.')
+    options, args = parser.parse_args()
+    size = int(options.size * 1024 * 1024)
+    page = make_page(size)
+
+    print 'Python %s, %d pages of %.1fMB, read by %dKB' % (
+        sys.version.split()[0], options.number, options.size, options.chunk)
+    print '%-28s %16s %10s' % ('receive', 'peak growth(MB)', 'MB/s')
+    for name, preallocate, recv_into in MODES:
+        peak, elapsed = fork_run(preallocate, recv_into, page, options.number,
+                                 options.chunk * 1024)
+        print '%-28s %16.1f %10.1f' % (name, peak / 1024.0,
+                                       len(page) * options.number / elapsed / 1024 / 1024)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+"""Measure the memory per object and the construction rate of the Request
+and Response objects, run it before and after changing them to compare."""
+
+from __future__ import with_statement
+
+import optparse
+import sys
+import os
+import time
+
+# Temporarily declare the search path for the package.
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+pkg_path = os.path.join(CUR_DIR, '..')
+sys.path.insert(0, pkg_path)
+
+from threaded_spider.http import Request, Response
+
+URL = 'http://news.sina.com.cn/c/2014-05-06/023930074432.shtml'
+BODY = '<html><body>%s</body></html>' % ('x' * 1000)
+HEADERS = {'content-type': 'text/html', 'content-length': str(len(BODY))}
+
+def object_size(obj):
+    """Bytes taken by the object itself and its instance dict if any,
+    the attribute values are shared by all the objects and not counted."""
+    size = sys.getsizeof(obj)
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    return size
+
+def rate(func, number):
+    """Return the calls of func per second."""
+    start = time.time()
+    for _ in xrange(number):
+        func()
+    return number / (time.time() - start)
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', dest='number', default=200000, type='int',
+                      help='Objects created for each measurement, %default by default.')
+    options, args = parser.parse_args()
+    n = options.number
+
+    request = Request(URL, depth=2, meta={'download_slot': 'news.sina.com.cn'})
+    response = Response(URL, headers=HEADERS, body=BODY, request=request)
+    cases = [
+        ('Request(url)', lambda: Request(URL)),
+        ('Request(url, meta)', lambda: Request(URL, depth=2, meta={'a': 1})),
+        ('request.replace(depth)', lambda: request.replace(depth=3)),
+        ('Response(url, headers, body)',
+         lambda: Response(URL, headers=HEADERS, body=BODY, request=request)),
+        ('response.replace(status)', lambda: response.replace(status=304)),
+    ]
+    if hasattr(Request, '_from_trusted'):
+        cases.append(('Request._from_trusted(url)', lambda: Request._from_trusted(URL)))
+        cases.append(('Response._from_trusted(url, headers, body)',
+                      lambda: Response._from_trusted(URL, headers=HEADERS, body=BODY,
+                                                     request=request)))
+
+    print 'Python %s, %d objects each' % (sys.version.split()[0], n)
+    print '%-44s %10s' % ('object', 'bytes')
+    print '%-44s %10d' % ('Request', object_size(request))
+    print '%-44s %10d' % ('Response', object_size(response))
+    print '%-44s %10s' % ('construction', 'per sec')
+    for name, func in cases:
+        print '%-44s %10d' % (name, rate(func, n))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Adjust the download delay and concurrency of each host to its latency,
+aiming at AUTOTHROTTLE_TARGET_CONCURRENCY requests in progress on the
+server in average, and back off when the server is overloaded.
+
+The target sets the delay. The concurrency starts at one request and
+grows up to the limit of the slot, CONCURRENT_REQUESTS_PER_DOMAIN or
+_PER_IP, or to the target rounded up if that's higher or there's no limit.
+
+The downloaders report every download, the scheduler asks for the delay
+and the concurrency of a host before dispatching a request to it.
+"""
+from __future__ import with_statement
+
+import math
+import socket
+import threading
+
+from threaded_spider import logger
+from threaded_spider.http.common import request_host
+
+# Statuses meaning the server is overloaded.
+BACKOFF_STATUSES = (429, 503)
+
+class _HostThrottle(object):
+
+    def __init__(self, delay, concurrency):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.latency = None
+        # The concurrency limit of the slot, given by the scheduler.
+        self.limit = 0
+
+class AutoThrottle(object):
+
+    def __init__(self, start_delay=1.0, min_delay=0.0, max_delay=60.0,
+                 target_concurrency=1.0, enabled=False, debug=False, stats=None):
+        self.start_delay = max(start_delay, min_delay)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_concurrency = max(target_concurrency, 0.1)
+        # The least the concurrency could grow to.
+        self.max_concurrency = max(1, int(math.ceil(self.target_concurrency)))
+        self.enabled = enabled
+        self.debug = debug
+        self.stats = stats
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(start_delay=settings.getfloat('AUTOTHROTTLE_START_DELAY', 1),
+                   min_delay=settings.getfloat('DOWNLOAD_DELAY', 0),
+                   max_delay=settings.getfloat('AUTOTHROTTLE_MAX_DELAY', 60),
+                   target_concurrency=settings.getfloat('AUTOTHROTTLE_TARGET_CONCURRENCY', 1),
+                   enabled=settings.getbool('AUTOTHROTTLE_ENABLED'),
+                   debug=settings.getbool('AUTOTHROTTLE_DEBUG'),
+                   stats=crawler.stats)
+
+    def _throttle(self, host):
+        throttle = self.hosts.get(host)
+        if throttle is None:
+            # Start cautiously with one request at a time.
+            throttle = self.hosts.setdefault(host, _HostThrottle(self.start_delay, 1.0))
+        return throttle
+
+    def get_delay(self, host):
+        if not self.enabled:
+            return 0
+        return self._throttle(host).delay
+
+    def get_concurrency(self, host, limit=0):
+        """Return how many requests could be downloaded from the host at once,
+        or 0 for no limit. `limit` is the configured one of its slot, 0 if
+        none, which the concurrency could grow to."""
+        if not self.enabled:
+            return 0
+        throttle = self._throttle(host)
+        throttle.limit = limit
+        return int(min(throttle.concurrency, self._max_concurrency(throttle)))
+
+    def _max_concurrency(self, throttle):
+        return max(self.max_concurrency, throttle.limit)
+
+    def response_received(self, request, status, latency):
+        """Called by the downloader with the status and the seconds
+        taken by a download."""
+        if not self.enabled:
+            return
+        if status in BACKOFF_STATUSES:
+            self._backoff(request, 'HTTP %d' % status)
+            return
+
+        host = request_host(request)
+        with self._lock:
+            throttle = self._throttle(host)
+            old_delay = throttle.delay
+            throttle.latency = latency
+            # The delay making TARGET_CONCURRENCY requests in progress
+            # on the server, approached gradually.
+            target_delay = latency / self.target_concurrency
+            delay = max(target_delay, (throttle.delay + target_delay) / 2.0)
+            delay = min(max(self.min_delay, delay), self.max_delay)
+            if status >= 400 and delay < throttle.delay:
+                # Error responses are often fast, they mustn't speed up.
+                delay = throttle.delay
+            throttle.delay = delay
+            # Additive increase of the concurrency.
+            throttle.concurrency = min(self._max_concurrency(throttle),
+                                       throttle.concurrency + 1.0 / throttle.concurrency)
+        if self.debug:
+            logger.info('@autothrottle, %s latency: %.3fs, delay: %.3fs -> %.3fs, '
+                        'concurrency: %d' % (host, latency, old_delay, delay,
+                                             int(throttle.concurrency)))
+
+    def download_failed(self, request, exc):
+        """Called by the downloader when a download fails, backs off on
+        timeouts and overloaded servers."""
+        if not self.enabled:
+            return
+        status = getattr(exc, 'status', None)
+        if status in BACKOFF_STATUSES or isinstance(exc, socket.timeout):
+            self._backoff(request, str(exc))
+
+    def _backoff(self, request, reason):
+        host = request_host(request)
+        with self._lock:
+            throttle = self._throttle(host)
+            throttle.delay = min(self.max_delay, max(throttle.delay * 2, self.start_delay))
+            throttle.concurrency = max(1.0, throttle.concurrency / 2.0)
+        if self.stats:
+            self.stats.inc_value('autothrottle/backoff')
+        logger.info('@autothrottle, back off %s to delay %.3fs, concurrency %d: %s'
+                    % (host, throttle.delay, int(throttle.concurrency), reason))
@@ -0,0 +1,240 @@
+"""
+Receive a response body chunk by chunk as it's read from the socket,
+decompress it on the fly and abort as soon as it's too large, or before
+reading any byte of it if its content type isn't wanted.
+
+A body larger than DOWNLOAD_SPILL_SIZE is written to an anonymous temporary
+file as it arrives, and the response gets a read-only mmap of the file as
+its body instead of a str. The mmap supports len(), slicing, find() and
+the buffer interface, so the body could be scanned, stored or written to a
+file without being copied onto the heap.
+
+A body whose Content-Length is at least DOWNLOAD_PREALLOCATE_SIZE and
+which isn't compressed nor spilled is received into a bytearray, which
+becomes the body of the response as is. The chunks aren't held and
+joined, and the event loop downloader receives the socket data straight
+into it with recv_into(). The bytearray is allocated when the first byte
+of the body arrives and doubled as needed up to the Content-Length, so a
+server declaring a large body without sending it doesn't take the memory.
+"""
+import zlib
+import mmap
+import tempfile
+
+from threaded_spider import logger
+
+# Decompress at most so many bytes each time, so that a small chunk
+# expanding to a huge body is aborted early.
+DECOMPRESS_SIZE = 256 * 1024
+
+# Sent with every request without its own Accept-Encoding header.
+ACCEPT_ENCODING = 'gzip, deflate'
+
+class SizeLimitExceeded(Exception):
+    """The response body exceeds DOWNLOAD_MAXSIZE."""
+
+class ContentTypeNotAllowed(Exception):
+    """The response content type isn't in the allowed content types."""
+
+def content_type_allowed(content_type, allowed_types):
+    """Whether the media type matches one of `allowed_types`, such as
+    'text/html' or 'text/*'. An unknown content type is allowed."""
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    if not content_type:
+        return True
+    main_type = content_type.split('/', 1)[0] + '/*'
+    for allowed in allowed_types:
+        allowed = allowed.lower()
+        if allowed == content_type or allowed == main_type:
+            return True
+    return False
+
+class ContentDecoder(object):
+    """Decompress a gzip or deflate encoded body incrementally."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = zlib.decompressobj()
+        self._first = True
+
+    def decompress(self, data):
+        """Yield the decompressed pieces of data."""
+        if self._first and self.encoding == 'deflate':
+            self._first = False
+            try:
+                out = self._decompressor.decompress(data, DECOMPRESS_SIZE)
+            except zlib.error:
+                # Some servers send raw deflate data without zlib header.
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            else:
+                yield out
+                data = self._decompressor.unconsumed_tail
+
+        while data:
+            yield self._decompressor.decompress(data, DECOMPRESS_SIZE)
+            data = self._decompressor.unconsumed_tail
+
+    def flush(self):
+        return self._decompressor.flush()
+
+class BodyReceiver(object):
+    """
+    Collect the body of a response.
+
+    @param maxsize: raise SizeLimitExceeded when the body, either the
+        compressed or the decompressed one, exceeds it. 0 to disable.
+    @param warnsize: log a warning once when the body exceeds it.
+        0 to disable.
+    @param allowed_types: raise ContentTypeNotAllowed when the Content-Type
+        doesn't match any of them. None to allow any.
+    @param spill_size: write the body to a temporary file in `spill_dir`
+        once it exceeds this size. 0 to disable.
+    @param preallocate_size: receive a body of known length at least this
+        size into a bytearray, grown from this size up to the length as the
+        data arrives. 0 to disable.
+    """
+
+    def __init__(self, url, headers, maxsize=0, warnsize=0, allowed_types=None,
+                 spill_size=0, spill_dir=None, preallocate_size=0):
+        self.url = url
+        self.maxsize = maxsize
+        self.warnsize = warnsize
+        self.spill_size = spill_size
+        self.spill_dir = spill_dir
+        self.received = 0
+        self.size = 0
+        self.parts = []
+        self.file = None
+        self.preallocate_size = preallocate_size
+        # The preallocated body filled up to `size`, created by the first
+        # data and grown up to `expected`, the Content-Length, if not 0.
+        self.buffer = None
+        self.expected = 0
+        self._warned = False
+
+        if allowed_types is not None:
+            content_type = headers.get('content-type', '')
+            if not content_type_allowed(content_type, allowed_types):
+                raise ContentTypeNotAllowed('%s content type %r not allowed'
+                                            % (url, content_type))
+
+        encoding = headers.get('content-encoding', '').strip().lower()
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            self.decoder = ContentDecoder(encoding)
+        else:
+            self.decoder = None
+
+        try:
+            expected = int(headers.get('content-length', -1))
+        except ValueError:
+            expected = -1
+        if expected > 0:
+            # Abort before reading any byte of the body.
+            self._check_size(expected)
+            if (self.decoder is None and preallocate_size and expected >= preallocate_size
+                    and not (spill_size and expected > spill_size)):
+                self.expected = expected
+
+    def _check_size(self, size):
+        if self.maxsize and size > self.maxsize:
+            raise SizeLimitExceeded('%s body size %d exceeds the limit %d'
+                                    % (self.url, size, self.maxsize))
+        if self.warnsize and size > self.warnsize and not self._warned:
+            self._warned = True
+            logger.warn('@downloader, %s body size %d exceeds the warning size %d'
+                        % (self.url, size, self.warnsize))
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def _reserve(self, size):
+        """Grow the preallocated body to hold `size` more bytes, return
+        False if they go beyond its Content-Length."""
+        end = self.size + size
+        if end > self.expected:
+            return False
+        if self.buffer is None:
+            self.buffer = bytearray()
+        length = len(self.buffer)
+        if end > length:
+            # Doubled, at most twice the bytes received.
+            grown = min(self.expected, max(end, 2 * length, self.preallocate_size))
+            self.buffer.extend(bytearray(grown - length))
+        return True
+
+    def _append(self, data):
+        if self.expected:
+            if self._reserve(len(data)):
+                end = self.size + len(data)
+                self.buffer[self.size:end] = data
+                self.size = end
+                return
+            # Longer than its Content-Length, collect it as usual.
+            if self.buffer is not None:
+                self.parts.append(str(buffer(self.buffer, 0, self.size)))
+            self.buffer = None
+            self.expected = 0
+        self.size += len(data)
+        if self.file is not None:
+            self.file.write(data)
+            return
+        self.parts.append(data)
+        if self.spill_size and self.size > self.spill_size:
+            self.file = tempfile.TemporaryFile(prefix='body-', dir=self.spill_dir)
+            for part in self.parts:
+                self.file.write(part)
+            self.parts = []
+
+    def feed(self, chunk):
+        self.received += len(chunk)
+        self._check_size(self.received)
+        if self.decoder is None:
+            self._append(chunk)
+            return
+
+        for data in self.decoder.decompress(chunk):
+            self._append(data)
+            self._check_size(self.size)
+
+    def writable(self, size):
+        """Return a memoryview of at most `size` bytes of the preallocated
+        body to receive into, or None if the body isn't preallocated."""
+        size = min(size, self.expected - self.size)
+        if size <= 0 or not self._reserve(size):
+            return None
+        return memoryview(self.buffer)[self.size:self.size + size]
+
+    def advance(self, size):
+        """Account for `size` bytes received into the view of `writable`."""
+        self.received += size
+        self.size += size
+
+    def getvalue(self):
+        """Return the body, a str, the preallocated bytearray or the mmap
+        of the spilled file."""
+        if self.decoder is not None:
+            self._append(self.decoder.flush())
+        if self.buffer is not None:
+            if self.size < len(self.buffer):
+                # Cut short, the downloader decides whether it's an error.
+                del self.buffer[self.size:]
+            return self.buffer
+        if self.file is None:
+            return ''.join(self.parts)
+
+        self.file.flush()
+        try:
+            # The mapping outlives the file, which is deleted on closing.
+            return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            self.file.close()
+
+    def decode_headers(self, headers):
+        """Remove Content-Encoding from the headers once decompressed."""
+        if self.decoder is not None:
+            headers.pop('content-encoding', None)
+        return headers
@@ -0,0 +1,164 @@
+"""
+Per-host circuit breakers, so that the requests to a dead host don't take
+the threads waiting for timeouts one after another.
+
+After BREAKER_FAILURE_THRESHOLD consecutive connection failures or timeouts
+the breaker of the host opens, and the scheduler holds its requests back.
+When BREAKER_OPEN_TIMEOUT passes a single probe request is let through
+(half open), the breaker closes if it succeeds, or opens again for twice
+as long. The queue of the host is dropped after BREAKER_MAX_PROBES failed
+probes in a row. Until the breaker closes, only the results of the probes
+count, not the late ones of the requests dispatched before it opened.
+"""
+from __future__ import with_statement
+
+import time
+import socket
+import threading
+
+from threaded_spider import logger
+from threaded_spider.http.common import request_host
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+class _HostBreaker(object):
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.failed_probes = 0
+        self.next_probe = 0
+        self.probe_started = None
+        # The request sent as the probe, whose result only counts while
+        # the breaker isn't closed.
+        self.probe = None
+        self.drop = False
+
+class CircuitBreaker(object):
+
+    def __init__(self, threshold=5, open_timeout=30, max_open_timeout=600,
+                 max_probes=3, probe_timeout=120, enabled=True, stats=None):
+        self.threshold = threshold
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.max_probes = max_probes
+        self.probe_timeout = probe_timeout
+        self.enabled = enabled and threshold > 0
+        self.stats = stats
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        # A probe which never reports back is given up after the timeouts.
+        probe_timeout = (settings.getfloat('DOWNLOAD_CONNECT_TIMEOUT', 10) +
+                         settings.getfloat('DOWNLOAD_TIMEOUT', 60)) * 2
+        return cls(threshold=settings.getint('BREAKER_FAILURE_THRESHOLD', 5),
+                   open_timeout=settings.getfloat('BREAKER_OPEN_TIMEOUT', 30),
+                   max_open_timeout=settings.getfloat('BREAKER_MAX_OPEN_TIMEOUT', 600),
+                   max_probes=settings.getint('BREAKER_MAX_PROBES', 3),
+                   probe_timeout=probe_timeout,
+                   enabled=settings.getbool('BREAKER_ENABLED', True),
+                   stats=crawler.stats)
+
+    def is_failure(self, exc):
+        """Whether the error means the host is unreachable or hung."""
+        return isinstance(exc, socket.error)
+
+    def allow(self, host, request, now=None):
+        """Called by the scheduler before dispatching a request to host,
+        return False to hold it back. A True in the half open state
+        makes the request the probe."""
+        if not self.enabled:
+            return True
+        breaker = self.hosts.get(host)
+        if breaker is None or breaker.state == CLOSED:
+            return True
+
+        now = now or time.time()
+        with self._lock:
+            if breaker.state == HALF_OPEN:
+                if now - breaker.probe_started < self.probe_timeout:
+                    return False
+                # The probe got lost, send another one.
+            elif now < breaker.next_probe:
+                return False
+            breaker.state = HALF_OPEN
+            breaker.probe_started = now
+            breaker.probe = request
+        self._inc_stats('breaker/probes')
+        logger.info('@breaker, probing %s' % host)
+        return True
+
+    def should_drop(self, host):
+        """Return True once after the probes to host failed BREAKER_MAX_PROBES
+        times, the scheduler drops its queued requests then."""
+        breaker = self.hosts.get(host)
+        if breaker is None or not breaker.drop:
+            return False
+        breaker.drop = False
+        return True
+
+    def record_result(self, request, exc=None):
+        """Called by the downloaders when a download finishes, `exc` is
+        the error if it failed."""
+        if not self.enabled:
+            return
+        host = request_host(request)
+        breaker = self.hosts.get(host)
+        if breaker is not None and breaker.state != CLOSED and request is not breaker.probe:
+            # Dispatched before the breaker opened, it tells nothing new.
+            self._inc_stats('breaker/late_results')
+            return
+        if exc is not None and self.is_failure(exc):
+            self._record_failure(host, exc)
+            return
+
+        if breaker is None:
+            return
+        with self._lock:
+            was_closed = breaker.state == CLOSED
+            breaker.state = CLOSED
+            breaker.probe = None
+            breaker.failures = breaker.failed_probes = 0
+        if not was_closed:
+            self._inc_stats('breaker/closed')
+            logger.info('@breaker, %s is back, breaker closed.' % host)
+            self._update_stats()
+
+    def _record_failure(self, host, exc):
+        with self._lock:
+            breaker = self.hosts.get(host)
+            if breaker is None:
+                breaker = self.hosts[host] = _HostBreaker()
+            breaker.failures += 1
+            if breaker.state == HALF_OPEN:
+                breaker.failed_probes += 1
+                if breaker.failed_probes >= self.max_probes:
+                    breaker.drop = True
+            elif breaker.state == OPEN or breaker.failures < self.threshold:
+                return
+            timeout = min(self.max_open_timeout,
+                          self.open_timeout * 2 ** breaker.failed_probes)
+            breaker.state = OPEN
+            breaker.probe = None
+            breaker.next_probe = time.time() + timeout
+            failed_probes = breaker.failed_probes
+
+        self._inc_stats('breaker/opened')
+        logger.warn('@breaker, %s failed %d times (%d probes), breaker open for %ds: %s'
+                    % (host, breaker.failures, failed_probes, timeout, exc))
+        self._update_stats()
+
+    def _inc_stats(self, key):
+        if self.stats:
+            self.stats.inc_value(key)
+
+    def _update_stats(self):
+        if not self.stats:
+            return
+        open_hosts = sorted(host for host, breaker in self.hosts.items()
+                            if breaker.state != CLOSED)
+        self.stats.set_value('breaker/open_hosts_count', len(open_hosts))
+        self.stats.set_value('breaker/open_hosts', open_hosts[:20])
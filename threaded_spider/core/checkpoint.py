@@ -0,0 +1,72 @@
+"""
+Save the unfinished requests of a crawl into a file and load them back
+to resume the crawl, one JSON object per line.
+
+JSON has no byte strings, so the url, headers and body are stored as the
+unicode strings of the same code points, decoded as latin-1, and encoded
+back on loading. Any bytes survive, such as a binary POST body.
+"""
+from __future__ import with_statement
+
+import json
+
+from threaded_spider.http import Request
+
+def _to_text(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    if isinstance(value, str):
+        return value.decode('latin-1')
+    return value
+
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    return value
+
+def save_requests(path, requests, spider=None):
+    """Write the requests to path and return the number of them.
+
+    The callback of a request is saved by name only if it's a method
+    of the spider, otherwise the spider's default callback is used on
+    resuming.
+    """
+    count = 0
+    with open(path, 'w') as f:
+        for request in requests:
+            callback = request.callback
+            if (callback is not None and spider is not None and
+                    getattr(callback, 'im_self', None) is spider):
+                callback = callback.__name__
+            else:
+                callback = None
+
+            headers = dict((_to_text(name), _to_text(value))
+                           for name, value in request.headers.iteritems())
+            d = {'url': _to_text(request.url), 'method': request.method,
+                 'headers': headers, 'body': _to_text(request.body),
+                 'depth': request.depth, 'encoding': request.encoding,
+                 'callback': callback}
+            f.write(json.dumps(d) + '\n')
+            count += 1
+    return count
+
+def load_requests(path, spider=None):
+    """Yield the requests saved by `save_requests`."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            d = json.loads(line)
+            callback = d.pop('callback', None)
+            if callback is not None and spider is not None:
+                callback = getattr(spider, callback)
+            else:
+                callback = None
+            headers = dict((_to_bytes(name), _to_bytes(value))
+                           for name, value in d['headers'].iteritems())
+            yield Request(_to_bytes(d['url']), callback=callback, method=str(d['method']),
+                          headers=headers, body=_to_bytes(d['body']), depth=d['depth'],
+                          encoding=str(d['encoding']))
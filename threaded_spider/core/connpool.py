@@ -0,0 +1,132 @@
+"""
+Pools of persistent HTTP connections, so that consecutive requests to
+the same host reuse the TCP connection(and the TLS session for https)
+instead of opening a new one every time.
+"""
+from __future__ import with_statement
+
+import time
+import httplib
+import threading
+
+from threaded_spider import logger
+
+class HTTPConnectionPool(object):
+    """
+    Idle httplib connections keyed by (scheme, host[:port]), and the proxy
+    if they go through one of core.proxypool.
+
+    A connection is taken out by `get` and must be given back by `put`
+    after the response has been read completely, or closed by `discard`
+    on failure. At most `maxsize` idle connections are kept for a host,
+    and the ones idle for more than `idle_timeout` seconds are closed.
+    """
+
+    connection_classes = {'http': httplib.HTTPConnection,
+                          'https': httplib.HTTPSConnection}
+
+    def __init__(self, maxsize=10, idle_timeout=30, stats=None, dnscache=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.stats = stats
+        self.dnscache = dnscache
+        # key -> list of (connection, the time it became idle)
+        self.idle = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(maxsize=settings.getint('CONNPOOL_MAXSIZE', 10),
+                   idle_timeout=settings.getfloat('CONNPOOL_IDLE_TIMEOUT', 30),
+                   stats=crawler.stats, dnscache=crawler.dnscache)
+
+    def _key(self, scheme, host, proxy):
+        if proxy is None:
+            return scheme, host
+        return scheme, host, proxy.netloc
+
+    def get(self, scheme, host, proxy=None):
+        """Return a (connection, reused) tuple for the host."""
+        key = self._key(scheme, host, proxy)
+        now = time.time()
+        conn = None
+        expired = []
+        with self._lock:
+            conns = self.idle.get(key, [])
+            while conns:
+                # The most recently used one is the least likely to be stale.
+                candidate, idle_since = conns.pop()
+                if now - idle_since > self.idle_timeout:
+                    expired.append(candidate)
+                else:
+                    conn = candidate
+                    break
+            if conn is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            hit_rate = float(self.hits) / (self.hits + self.misses)
+
+        for candidate in expired:
+            candidate.close()
+        if self.stats:
+            if expired:
+                self.stats.inc_value('connpool/expired', len(expired))
+            if conn is not None:
+                self.stats.inc_value('connpool/reused')
+            else:
+                self.stats.inc_value('connpool/new_connections')
+            self.stats.set_value('connpool/hit_rate', round(hit_rate, 3))
+
+        if conn is not None:
+            return conn, True
+        return self._new_connection(scheme, host, proxy), False
+
+    def _new_connection(self, scheme, host, proxy=None):
+        try:
+            conn_cls = self.connection_classes[scheme]
+        except KeyError:
+            raise ValueError('Unsupported url scheme: %s' % scheme)
+        # httplib parses the port from host.
+        if proxy is None:
+            conn = conn_cls(host)
+        else:
+            conn = conn_cls(proxy.netloc)
+            if scheme == 'https':
+                # Tunnel the TLS connection through the proxy by CONNECT.
+                conn.set_tunnel(host, headers={'Proxy-Authorization': proxy.auth}
+                                if proxy.auth else None)
+        if self.dnscache is not None:
+            conn._create_connection = self.dnscache.create_connection
+        return conn
+
+    def idle_count(self, host):
+        """Return the idle connections to the host of any scheme, read
+        without the lock, so it's only a hint."""
+        return sum(len(self.idle.get((scheme, host), ()))
+                   for scheme in self.connection_classes)
+
+    def put(self, scheme, host, conn, proxy=None):
+        """Give back a connection whose response has been read."""
+        key = self._key(scheme, host, proxy)
+        with self._lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.maxsize:
+                conns.append((conn, time.time()))
+                return
+        conn.close()
+
+    def discard(self, conn):
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn, idle_since in conns:
+                conn.close()
+        logger.info('@connpool, closed, hits: %d, new connections: %d'
+                    % (self.hits, self.misses))
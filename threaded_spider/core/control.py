@@ -0,0 +1,134 @@
+"""
+The control channel to reconfigure a running crawler without restarting it.
+
+The control file(CONTROL_FILE setting) holds a JSON object such as::
+
+    {"THREAD_NUM": 10,
+     "DOWNLOAD_DELAY": 0.5,
+     "DOWNLOAD_DELAY_PER_HOST": {"news.sina.com.cn": 2},
+     "CONCURRENT_REQUESTS_PER_DOMAIN": 4,
+     "LOG_LEVEL": "DEBUG"}
+
+It is read again when the process receives SIGUSR1 or when its modification
+time changes, and the options are applied by the main thread between two
+scheduling cycles.
+"""
+from __future__ import with_statement
+
+import os
+import time
+import json
+import signal
+
+from threaded_spider import logger
+
+class ControlChannel(object):
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.settings = crawler.settings
+        self.control_file = self.settings.get('CONTROL_FILE')
+        self.poll_interval = self.settings.getfloat('CONTROL_POLL_INTERVAL', 5)
+        self._mtime = None
+        self._next_poll = 0
+        self.handlers = {
+            'THREAD_NUM': self._set_thread_num,
+            'DOWNLOAD_DELAY': self._set_download_delay,
+            'DOWNLOAD_DELAY_PER_HOST': self._set_host_delays,
+            'CONCURRENT_REQUESTS_PER_DOMAIN': self._set_per_domain,
+            'CONCURRENT_REQUESTS_PER_IP': self._set_per_ip,
+            'LOG_LEVEL': self._set_log_level,
+        }
+
+    def install(self):
+        # Only the later modifications are applied, the options in the file
+        # when crawler starts should be passed as settings.
+        if self.control_file:
+            self._mtime = self._get_mtime()
+            logger.info('@control, watching control file %s' % self.control_file)
+
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        # Avoid the race conditions in the signal handler, see
+        # Crawler._handle_shutdown for more details.
+        self.crawler.call_later(self.reload)
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.control_file).st_mtime
+        except OSError:
+            return None
+
+    def poll(self):
+        """Called by the main thread in every scheduling cycle, reload the
+        control file if it has been modified."""
+        if not self.control_file:
+            return
+
+        now = time.time()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+
+        mtime = self._get_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self.reload()
+
+    def reload(self):
+        if not self.control_file:
+            logger.warn('@control, no control file to reload, set CONTROL_FILE first.')
+            return
+
+        self._mtime = self._get_mtime()
+        try:
+            with open(self.control_file) as f:
+                values = json.load(f)
+        except Exception:
+            logger.error(why='@control, fail to read control file %s' % self.control_file)
+            return
+
+        if not isinstance(values, dict):
+            logger.warn('@control, control file must hold a JSON object, got %r' % values)
+            return
+        self.apply(values)
+
+    def apply(self, values):
+        for name, value in values.items():
+            name = str(name)
+            handler = self.handlers.get(name)
+            if handler is None:
+                logger.warn('@control, unknown control option %s ignored.' % name)
+                continue
+
+            try:
+                handler(value)
+            except Exception:
+                logger.error(why='@control, fail to set %s to %r' % (name, value))
+            else:
+                self.settings.set(name, value)
+                logger.info('@control, %s set to %r' % (name, value))
+
+    def _set_thread_num(self, value):
+        thread_num = int(value)
+        if thread_num < 1:
+            raise ValueError('THREAD_NUM must be positive, got %r' % value)
+        self.crawler.engine.thread_pool.adjustPoolsize(thread_num, thread_num)
+
+    def _set_download_delay(self, value):
+        self.crawler.engine.scheduler.delay = float(value)
+
+    def _set_host_delays(self, value):
+        host_delays = dict((str(host).lower(), float(delay))
+                           for host, delay in value.items())
+        self.crawler.engine.scheduler.host_delays = host_delays
+
+    def _set_per_domain(self, value):
+        self.crawler.engine.scheduler.per_domain = int(value)
+
+    def _set_per_ip(self, value):
+        self.crawler.engine.scheduler.per_ip = int(value)
+
+    def _set_log_level(self, value):
+        logger.set_level(value)
@@ -0,0 +1,225 @@
+"""
+Cache the resolved addresses of hostnames for the downloaders, so that a
+blocking getaddrinfo isn't done for every connection, and resolve the hosts
+of newly scheduled requests in the background before they're downloaded.
+The event loop downloader, which mustn't block, has the missing ones
+resolved in the background as well.
+"""
+from __future__ import with_statement
+
+import time
+import Queue
+import socket
+import threading
+from collections import OrderedDict
+
+from threaded_spider import logger
+
+class DNSCache(object):
+    """
+    A LRU cache of getaddrinfo results keyed by hostname.
+
+    The system resolver doesn't tell the TTL of the records, so every
+    entry lives `ttl` seconds, and at most `maxsize` hostnames are kept.
+    """
+
+    def __init__(self, ttl=300, maxsize=10000, prefetch_threads=2,
+                 enabled=True, stats=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.prefetch_threads = prefetch_threads
+        self.enabled = enabled
+        self.stats = stats
+        # hostname -> (expire time, [(family, socktype, proto, canonname, sockaddr)])
+        self.cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetch_queue = Queue.Queue()
+        self._prefetching = set()
+        # hostname -> [(port, callback)] waiting for resolve_async.
+        self._waiters = {}
+        self._threads = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(ttl=settings.getfloat('DNSCACHE_TTL', 300),
+                   maxsize=settings.getint('DNSCACHE_SIZE', 10000),
+                   prefetch_threads=settings.getint('DNSCACHE_PREFETCH_THREADS', 2),
+                   enabled=settings.getbool('DNSCACHE_ENABLED', True),
+                   stats=crawler.stats)
+
+    def _inc_stats(self, key, count=1):
+        if self.stats:
+            self.stats.inc_value('dnscache/%s' % key, count)
+
+    def _lookup(self, host):
+        with self._lock:
+            entry = self.cache.get(host)
+            if entry is None:
+                return None
+            expire, addrs = entry
+            if expire < time.time():
+                del self.cache[host]
+                return None
+            # Move it to the end as the most recently used one.
+            del self.cache[host]
+            self.cache[host] = entry
+            return addrs
+
+    def cached_address(self, host):
+        """Return the first cached IP address of host, or None if it isn't
+        resolved yet, without blocking."""
+        if not self.enabled or not host:
+            return None
+        addrs = self._lookup(host.lower())
+        if not addrs:
+            return None
+        return addrs[0][4][0]
+
+    def _resolve(self, host):
+        addrs = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        evicted = 0
+        with self._lock:
+            self.cache.pop(host, None)
+            self.cache[host] = (time.time() + self.ttl, addrs)
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._inc_stats('evicted', evicted)
+        return addrs
+
+    def _with_port(self, addrs, port):
+        # Cached with port 0, sockaddr is (host, port) or
+        # (host, port, flowinfo, scopeid) for IPv6.
+        return [(family, socktype, proto, canonname,
+                 (sockaddr[0], port) + tuple(sockaddr[2:]))
+                for family, socktype, proto, canonname, sockaddr in addrs]
+
+    def getaddrinfo(self, host, port):
+        """Return the getaddrinfo(host, port, 0, SOCK_STREAM) result."""
+        if not self.enabled:
+            return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+        host = host.lower()
+        addrs = self._lookup(host)
+        if addrs is None:
+            self._inc_stats('miss')
+            addrs = self._resolve(host)
+        else:
+            self._inc_stats('hit')
+        return self._with_port(addrs, port)
+
+    def cached_addrinfo(self, host, port):
+        """Return the getaddrinfo result of host if cached, else None,
+        without blocking."""
+        if not self.enabled:
+            return None
+        addrs = self._lookup(host.lower())
+        if addrs is None:
+            return None
+        self._inc_stats('hit')
+        return self._with_port(addrs, port)
+
+    def resolve_async(self, host, port, callback):
+        """Resolve host in a background thread, which then calls
+        `callback(addrinfo, None)` with the getaddrinfo result, or
+        `callback(None, exc)` if the resolution fails. Used by the event loop
+        downloader, which mustn't block on the resolver."""
+        host = host.lower()
+        self._inc_stats('miss')
+        with self._lock:
+            self._waiters.setdefault(host, []).append((port, callback))
+            if host in self._prefetching:
+                # Being resolved already, wait for it.
+                return
+            self._prefetching.add(host)
+        self._prefetch_queue.put(host)
+        self._start_threads()
+
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                          source_address=None):
+        """The same as socket.create_connection but resolve through the
+        cache, to be used as `_create_connection` of httplib connections."""
+        host, port = address
+        err = None
+        for family, socktype, proto, _, sockaddr in self.getaddrinfo(host, port):
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error, e:
+                err = e
+                if sock is not None:
+                    sock.close()
+        if err is not None:
+            raise err
+        raise socket.error('getaddrinfo returns an empty list')
+
+    def prefetch(self, host):
+        """Resolve the host in a background thread unless it's cached."""
+        if not self.enabled or not self.prefetch_threads or not host:
+            return
+        host = host.lower()
+        if host in self._prefetching or self._lookup(host) is not None:
+            return
+
+        with self._lock:
+            if host in self._prefetching:
+                return
+            self._prefetching.add(host)
+        self._prefetch_queue.put(host)
+        self._start_threads()
+
+    def _start_threads(self):
+        # Called by the engine and the event loop threads.
+        with self._lock:
+            if self._threads:
+                return
+            # At least one for resolve_async, even if prefetching is off.
+            for i in xrange(max(self.prefetch_threads, 1)):
+                t = threading.Thread(target=self._prefetch_worker,
+                                     name='dns_prefetch_%d' % i)
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
+
+    def _prefetch_worker(self):
+        while True:
+            host = self._prefetch_queue.get()
+            if host is None:
+                break
+            addrs = error = None
+            try:
+                if self.enabled:
+                    addrs = self._resolve(host)
+                else:
+                    addrs = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+                self._inc_stats('prefetched')
+            except Exception, e:
+                # The download will fail and log the error itself.
+                error = e
+                self._inc_stats('prefetch_errors')
+                logger.debug('@dnscache, fail to prefetch %s: %s' % (host, e))
+            with self._lock:
+                self._prefetching.discard(host)
+                waiters = self._waiters.pop(host, ())
+            for port, callback in waiters:
+                try:
+                    if error is None:
+                        callback(self._with_port(addrs, port), None)
+                    else:
+                        callback(None, error)
+                except Exception:
+                    logger.error(why='@dnscache, resolve callback for %s failed' % host)
+
+    def close(self):
+        with self._lock:
+            for t in self._threads:
+                self._prefetch_queue.put(None)
+            self._threads = []
@@ -1,59 +1,310 @@
-"""Downloader to send a request to get a response."""
-import urllib2
-import socket
-socket.setdefaulttimeout(60)
-import gzip
-
-from threaded_spider import logger
-from threaded_spider.basic.compat import NativeStringIO
-from threaded_spider.http import Response, Request
-
-class Downloader(object):
-    
-    def __init__(self, crawler):
-        self.settings = crawler.settings
-        self.active = []
-    
-    def fetch(self, request, spider):
-        try:
-            self.active.append(request)
-            response = self._download(request)
-            return response
-        except Exception, e:
-            logger.error(why='@downloader, fetch %s failed' % request, spider=spider)
-        finally:
-            self.active.remove(request)
-        
-    def _download(self, request):
-        # Exceed the depth limit for crawler settings, return None to ignore.
-        if self.settings.get('MAX_DEPTH', 0) == 0:
-            pass
-        elif request.depth > self.settings.get('MAX_DEPTH', 0):
-            return None
-        
-        url_file = urllib2.urlopen(request.url)
-        is_gzip = False
-        cont_encode = url_file.headers.get('content-encoding', False)
-        if cont_encode == 'gzip':
-            is_gzip = True
-            
-        data = url_file.read()
-        if is_gzip:
-            data = self._ungzip(data)
-        
-        resp = Response(url_file.geturl(), status=url_file.getcode(), 
-                        headers=dict(url_file.headers.items()),
-                        body=data, request=request
-                        )
-        return resp
-        
-    def _ungzip(self, data): 
-        stream = NativeStringIO()
-        stream.write(data)
-        stream.seek(0)
-        gzipper = gzip.GzipFile(fileobj=stream)
-        data = gzipper.read()
-        return data
-    
-    def has_pending_download(self):
-        return len(self.active) 
+"""Downloader to send a request to get a response."""
+import time
+import httplib
+import urlparse
+import socket
+
+from threaded_spider import logger
+from threaded_spider.http import Response, Request, Headers
+from threaded_spider.core.connpool import HTTPConnectionPool
+from threaded_spider.core.httpcache import HttpCache
+from threaded_spider.core.retry import RetryPolicy
+from threaded_spider.core.timeouts import DownloadTimeouts
+from threaded_spider.core.ratelimit import RateLimiter
+from threaded_spider.core.proxypool import ProxyPool
+from threaded_spider.core.bodyreceiver import (BodyReceiver, SizeLimitExceeded,
+                                               ContentTypeNotAllowed, ACCEPT_ENCODING)
+
+# Follow redirections at most 10 times by default just like urllib2.
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Responses which never have a body.
+NO_BODY_STATUSES = (204, 304)
+
+# Bytes read from the socket each time.
+READ_CHUNK_SIZE = 64 * 1024
+
+class HttpError(Exception):
+    """The response status is not successful."""
+
+    def __init__(self, url, status, reason=''):
+        super(HttpError, self).__init__(url, status, reason)
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+    def __str__(self):
+        return 'HTTP %d %s: %s' % (self.status, self.reason, self.url)
+
+class Downloader(object):
+
+    # Whether the downloads are done by `fetch_async` instead of `fetch`
+    # in the engine threadpool.
+    asynchronous = False
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.settings = crawler.settings
+        self.stats = crawler.stats
+        self.active = []
+        self.user_agent = self.settings.get('USER_AGENT')
+        self.maxsize = self.settings.getint('DOWNLOAD_MAXSIZE', 0)
+        self.warnsize = self.settings.getint('DOWNLOAD_WARNSIZE', 0)
+        self.allowed_content_types = self.settings.get('DOWNLOAD_ALLOWED_CONTENT_TYPES')
+        self.spill_size = self.settings.getint('DOWNLOAD_SPILL_SIZE', 0)
+        self.spill_dir = self.settings.get('DOWNLOAD_SPILL_DIR')
+        self.preallocate_size = self.settings.getint('DOWNLOAD_PREALLOCATE_SIZE', 0)
+        self.pool = HTTPConnectionPool.from_crawler(crawler)
+        self.timeouts = DownloadTimeouts.from_crawler(crawler)
+        self.retry = RetryPolicy.from_crawler(crawler)
+        self.autothrottle = crawler.autothrottle
+        self.breaker = crawler.breaker
+        self.dupefilter = crawler.dupefilter
+        self.max_redirects = self.settings.getint('REDIRECT_MAX_TIMES', MAX_REDIRECTS)
+        self.bandwidth = RateLimiter(self.settings.getfloat('RATELIMIT_BYTES_PER_SEC', 0),
+                                     self.settings.getfloat('RATELIMIT_BYTES_PER_SEC_PER_HOST', 0),
+                                     name='bytes', stats=self.stats)
+        # Read smaller chunks under a low bandwidth limit, so that it's
+        # shaped by about 10 pauses a second instead of a long one.
+        rates = [r for r in (self.bandwidth.rate, self.bandwidth.host_rate) if r]
+        if rates:
+            self.read_size = int(max(1024, min(READ_CHUNK_SIZE, min(rates) / 10)))
+        else:
+            self.read_size = READ_CHUNK_SIZE
+        if self.settings.getbool('HTTPCACHE_ENABLED'):
+            self.httpcache = HttpCache.from_crawler(crawler)
+        else:
+            self.httpcache = None
+        if self.settings.get('PROXY_LIST'):
+            self.proxies = ProxyPool.from_crawler(crawler)
+        else:
+            self.proxies = None
+
+    def fetch(self, request, spider):
+        try:
+            self.active.append(request)
+            start = time.time()
+            response = self._download(request)
+            self.breaker.record_result(request)
+            if response is not None:
+                self.autothrottle.response_received(request, response.status,
+                                                    time.time() - start)
+            return response
+        except SizeLimitExceeded, e:
+            self.breaker.record_result(request)
+            self.stats.inc_value('downloader/maxsize_exceeded')
+            logger.warn('@downloader, fetch %s aborted: %s' % (request, e), spider=spider)
+        except ContentTypeNotAllowed, e:
+            self.breaker.record_result(request)
+            self.stats.inc_value('downloader/content_type_aborted')
+            logger.debug('@downloader, fetch %s aborted: %s' % (request, e), spider=spider)
+        except Exception, e:
+            if isinstance(e, socket.timeout):
+                self.stats.inc_value('downloader/timeouts')
+            self.breaker.record_result(request, e)
+            self.autothrottle.download_failed(request, e)
+            # The engine schedules a returned request again.
+            retry = self.retry.retry_request(request, e, spider)
+            if retry is not None:
+                return retry
+            logger.error(why='@downloader, fetch %s failed' % request, spider=spider)
+        finally:
+            self.active.remove(request)
+
+    def _exceeds_max_depth(self, request):
+        # Exceed the depth limit for crawler settings, should be ignored.
+        if self.settings.get('MAX_DEPTH', 0) == 0:
+            return False
+        return request.depth > self.settings.get('MAX_DEPTH', 0)
+
+    def content_types(self, request):
+        """Return the content types allowed for the response of a request,
+        by meta allowed_content_types, the spider attribute of the same
+        name or DOWNLOAD_ALLOWED_CONTENT_TYPES. None allows any."""
+        if 'allowed_content_types' in request.meta:
+            return request.meta['allowed_content_types']
+        # The downloader is created before the engine gets the spider.
+        spider = getattr(getattr(self.crawler, 'engine', None), 'spider', None)
+        return getattr(spider, 'allowed_content_types', None) or self.allowed_content_types
+
+    def _receiver(self, request, url, status, headers):
+        """Return the BodyReceiver of a response."""
+        # Only the wanted body is checked, not redirections nor errors.
+        content_types = self.content_types(request) if 200 <= status < 300 else None
+        if request.method == 'HEAD' or status in NO_BODY_STATUSES:
+            # The Content-Length, if any, isn't of a body following.
+            preallocate_size = 0
+        else:
+            preallocate_size = self.preallocate_size
+        return BodyReceiver(url, headers, self.maxsize, self.warnsize, content_types,
+                            self.spill_size, self.spill_dir, preallocate_size)
+
+    def _body(self, receiver):
+        body = receiver.getvalue()
+        if receiver.spilled:
+            self.stats.inc_value('downloader/spilled_bodies')
+            self.stats.inc_value('downloader/spilled_bytes', len(body))
+        return body
+
+    def _download(self, request):
+        if self._exceeds_max_depth(request):
+            return None
+
+        entry = None
+        request_headers = request.headers
+        if self.httpcache is not None:
+            entry = self.httpcache.lookup(request)
+            if entry is not None and self.httpcache.is_fresh(entry, request):
+                return entry.response
+            request_headers = self.httpcache.conditional_headers(entry, request_headers)
+
+        url, method, body = request.url, request.method, request.body or None
+        while True:
+            status, reason, headers, data = self._http_request(request, method, url,
+                                                               request_headers, body)
+            location = headers.get('location')
+            if (status not in REDIRECT_STATUSES or not location or
+                    request.meta.get('dont_redirect')):
+                break
+            target = self._redirect_target(request, url, status, location, method, body)
+            if target is None:
+                return None
+            url, method, body = target
+
+        if status >= 400:
+            raise HttpError(url, status, reason)
+
+        resp = Response._from_trusted(url, status=status, headers=headers,
+                                      body=data, request=request)
+        if self.httpcache is not None:
+            resp = self.httpcache.process_response(request, resp, entry)
+        return resp
+
+    def _redirect_target(self, request, url, status, location, method, body):
+        """Return the (url, method, body) to follow a redirection, or None
+        if its target has been seen by the dupe filter."""
+        redirect_urls = request.meta.setdefault('redirect_urls', [])
+        if len(redirect_urls) >= self.max_redirects:
+            raise HttpError(url, status, 'Too many redirections')
+        redirect_urls.append(url)
+
+        target = urlparse.urljoin(url, location)
+        if status == 303 or (status in (301, 302) and method == 'POST'):
+            method, body = 'GET', None
+        if not request.meta.get('dont_filter') and \
+                self.dupefilter.url_seen(target, method, body):
+            self.stats.inc_value('dupefilter/redirect_filtered')
+            logger.debug('@downloader, drop %s redirected to the seen %s' % (request, target))
+            return None
+        return target, method, body
+
+    def _http_request(self, request, method, url, headers, body):
+        """Send a request through a pooled connection, and return the status,
+        reason, headers and body of its response."""
+        if self.proxies is None or request.meta.get('dont_proxy'):
+            return self._send(request, method, url, headers, body)
+
+        proxy = self.proxies.acquire()
+        healthy = False
+        try:
+            result = self._send(request, method, url, headers, body, proxy)
+            healthy = result[0] not in self.proxies.ban_codes
+            return result
+        except (SizeLimitExceeded, ContentTypeNotAllowed):
+            # Aborted by us, not a failure of the proxy.
+            healthy = True
+            raise
+        finally:
+            self.proxies.release(proxy, healthy)
+
+    def _send(self, request, method, url, headers, body, proxy=None):
+        scheme, netloc, path, query, _ = urlparse.urlsplit(url)
+        host = netloc.rpartition('@')[2].lower()
+        path = path or '/'
+        if query:
+            path = '%s?%s' % (path, query)
+        headers = self._default_headers(headers)
+        if proxy is not None and scheme == 'http':
+            # The absolute URI is sent to a proxy, httplib takes the Host
+            # header from it.
+            path = urlparse.urldefrag(url)[0]
+            if proxy.auth:
+                headers['Proxy-Authorization'] = proxy.auth
+        connect_timeout, read_timeout = self.timeouts.get(request, host)
+
+        while True:
+            conn, reused = self.pool.get(scheme, host, proxy)
+            start = time.time()
+            try:
+                if conn.sock is None:
+                    conn.timeout = connect_timeout
+                    conn.connect()
+                conn.sock.settimeout(read_timeout)
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+            except socket.timeout:
+                self.pool.discard(conn)
+                raise
+            except (httplib.HTTPException, socket.error):
+                self.pool.discard(conn)
+                if reused:
+                    # The server may have closed the idle connection,
+                    # so try again.
+                    self.stats.inc_value('connpool/stale_reconnects')
+                    continue
+                raise
+
+            if (resp.status in REDIRECT_STATUSES and resp.getheader('location')
+                    and resp.length is None and not resp.chunked):
+                # Some servers keep the connection open after a redirection
+                # without body length, don't wait for its body.
+                self.pool.discard(conn)
+                return (resp.status, resp.reason,
+                        Headers.from_raw(''.join(resp.msg.headers), resp.msg.dict), '')
+
+            # Looked up in the dict of httplib, the raw lines parsed again
+            # only for the repeated headers or if changed.
+            resp_headers = Headers.from_raw(''.join(resp.msg.headers), resp.msg.dict)
+            try:
+                receiver = self._receiver(request, url, resp.status, resp_headers)
+                while True:
+                    chunk = resp.read(self.read_size)
+                    if not chunk:
+                        break
+                    receiver.feed(chunk)
+                    wait = self.bandwidth.consume(host, len(chunk))
+                    if wait > 0:
+                        time.sleep(wait)
+                data = self._body(receiver)
+            except:
+                self.pool.discard(conn)
+                raise
+
+            if resp.will_close:
+                self.pool.discard(conn)
+            else:
+                self.pool.put(scheme, host, conn, proxy)
+            self.timeouts.record(host, time.time() - start)
+            return resp.status, resp.reason, receiver.decode_headers(resp_headers), data
+
+    def _default_headers(self, headers):
+        headers = dict(headers)
+        names = set(name.lower() for name in headers)
+        if self.user_agent and 'user-agent' not in names:
+            headers['User-Agent'] = self.user_agent
+        if 'accept-encoding' not in names:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+        return headers
+
+    def idle_connections(self, host):
+        """Return how many idle connections to the host could be reused."""
+        return self.pool.idle_count(host)
+
+    def has_pending_download(self):
+        return len(self.active)
+
+    def close(self):
+        self.pool.close()
+        if self.proxies is not None:
+            logger.info('@downloader, proxies(proxy, score, active, ejected): %r'
+                        % self.proxies.proxy_stats())
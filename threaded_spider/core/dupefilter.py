@@ -0,0 +1,54 @@
+"""
+Filter the requests already scheduled or downloaded, by the fingerprint
+of the method, url and body. The downloaders also record the urls of
+the redirections, so that an alias url redirected to a seen page is
+dropped instead of downloaded again.
+"""
+from __future__ import with_statement
+
+import threading
+
+from threaded_spider import logger
+from threaded_spider.http.common import fingerprint, request_fingerprint
+
+class RequestDupeFilter(object):
+
+    def __init__(self, enabled=True, stats=None):
+        self.enabled = enabled
+        self.stats = stats
+        self.fingerprints = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(enabled=crawler.settings.getbool('DUPEFILTER_ENABLED', True),
+                   stats=crawler.stats)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def _add(self, fp):
+        """Record the fingerprint and return whether it was seen."""
+        with self._lock:
+            if fp in self.fingerprints:
+                return True
+            self.fingerprints.add(fp)
+            return False
+
+    def request_seen(self, request):
+        """Record the request and return whether it was seen, requests
+        with meta dont_filter are never filtered."""
+        if not self.enabled or request.meta.get('dont_filter'):
+            return False
+        if self._add(request_fingerprint(request)):
+            if self.stats:
+                self.stats.inc_value('dupefilter/filtered')
+            logger.debug('@dupefilter, filtered duplicate request: %s' % request)
+            return True
+        return False
+
+    def url_seen(self, url, method='GET', body=None):
+        """Record the target of a redirection and return whether it was seen."""
+        if not self.enabled:
+            return False
+        return self._add(fingerprint(method, url, body))
@@ -1,177 +1,295 @@
-"""
-This module implements the engine which controls
-the Scheduler, Downloader and Spider.
-"""
-import time
-
-from threaded_spider import logger
-from threaded_spider.basic.threadpool import ThreadPool    
-from threaded_spider.http import Request, Response
-from threaded_spider.core.downloader import Downloader
-from threaded_spider.core.scheduler import Scheduler
-from threaded_spider.core.extracter import Extracter
-
-class Engine(object):
-    
-    def __init__(self, crawler):
-        self.crawler = crawler
-        self.settings = crawler.settings
-        self.downloader = Downloader(crawler)
-        self.scheduler = Scheduler()
-        self.requests_to_be_scheduled = []
-        self.extracter = Extracter(crawler)
-        self.thread_pool = ThreadPool(minthreads=self.settings.getint('THREAD_NUM', 7),
-                                      maxthreads=self.settings.getint('THREAD_NUM', 7),
-                                      name='engine_threadpool')
-        self.spider = None
-        self.running = False
-        
-    def start(self):
-        """Start the execution engine"""
-        
-        assert not self.running, 'Engine already running.'
-        
-        self.start_time = time.time()
-        self.running = True
-        self.thread_pool.start()
-        
-    def stop(self, force=False):
-        """Stop the execution engine gracefully"""
-        
-        assert self.running, 'Engine not running.'
-        logger.info('@engine, stopping...')
-        # Stop the threadpool and close spider.
-        self.thread_pool.stop()
-        self.thread_pool.dumpStats()
-        self.detach_spider()
-        
-        self.running = False
-        logger.info('@engine, stopped.')
-        logger.info('@engine, unscheduled: %s' % len(self.requests_to_be_scheduled))
-        logger.debug('@engine, unscheduled: %r' % self.requests_to_be_scheduled)
-        logger.info('@engine, in scheduler: %s' % self.scheduler.mq.qsize())
-        logger.debug('@engine, in scheduler: %r' % self.scheduler.mq.queue)
-        logger.info('@engine, in downloader: %s' % self.downloader.has_pending_download())
-    
-    def attach_spider(self, spider, start_requests=()):
-        """Attach a spider to the engine."""
-        logger.info('@engine, Spider attached to engine.', spider=spider)
-        self.spider = spider
-        if callable(start_requests):
-            start_requests = start_requests()
-        self._start_requests = iter(start_requests)
-        
-        self.scheduler.attach_spider(spider)
-        self.extracter.attach_spider(spider)
-    
-    def detach_spider(self):
-        self.extracter.detach_spider()
-        
-    def process_next_request(self, spider):
-        self._process_next_request(spider)    
-          
-    def _process_next_request(self, spider):
-        """Grab a request object from scheduler and then download a 
-        response object which is parsed by the spider.
-        """
-        request = self._process_next_request_from_scheduler(spider)
-        
-        if not request and self._start_requests:
-            try:
-                request = next(self._start_requests)
-            except StopIteration:
-                self._start_requests = None
-            except Exception:
-                logger.error(why='@engine, Fail to obtain request from start requests.',
-                             spider=spider)
-            else:
-                logger.info('@engne, schedule a request from start_urls', spider=spider)
-                self._schedule(request, spider)
-        
-        if self.spider_is_idle(spider):
-            logger.info('@engine, Spider is idle.', spider=spider)
-            self._spider_idle(spider)
-                
-    def _process_next_request_from_scheduler(self, spider):
-        self._schedule2()
-        request = self.scheduler.next_request()
-        if not request:
-            return
-        
-        def handle_download_output(succeed, result):
-            self._handle_download_output(result, request, spider)
-        
-        # Error raised by tasks in the thread pool will be logged as 
-        # `Unhandled Error` by default and not break down the main thread.    
-        self.call_in_thread_with_callback(handle_download_output, self.download,
-                                          request, spider)
-        return request
-    
-    # Sub-threads use this to schedule later instead of 
-    # operating on the scheduler queue directly.
-    def schedule_later(self, request, spider):
-        self.requests_to_be_scheduled.append((request, spider))
-    
-    # Main thread use two below to put request to the scheduler queue.
-    def _schedule(self, request, spider):
-        self.scheduler.enqueue_request(request)
-    
-    def _schedule2(self):
-        while self.requests_to_be_scheduled:
-            try:   
-                item = self.requests_to_be_scheduled[0]
-                self.requests_to_be_scheduled.remove(item)
-            except IndexError:
-                return
-        
-            request, spider = item
-            self.scheduler.enqueue_request(request)    
-        
-    def spider_is_idle(self, spider):
-        # Judge whether there is any request to be processed.
-        has_unscheduled_request = len(self.requests_to_be_scheduled)
-        has_pending_request = self.scheduler.has_pending_requests()
-        has_pending_download = self.downloader.has_pending_download()
-        has_pending_response = self.extracter.has_pending_response()
-        has_pending_task = self.thread_pool.has_pending_task() 
-        return not any((has_unscheduled_request, has_pending_request, 
-                        has_pending_download, has_pending_response, 
-                        has_pending_task))
-    
-    def _spider_idle(self, spider):
-        self.crawler.stop()
-    
-    def call_in_thread(self, func, *args, **kws):
-        self.thread_pool.callInThread(func, *args, **kws)
-        
-    def call_in_thread_with_callback(self, onResult, func, *args, **kws):
-        self.thread_pool.callInThreadWithCallback(onResult, func, *args, **kws)
-        
-    def download(self, request, spider):
-        if self.crawler.stopped:
-                # Immediatelly exit once the crawler receive the stop signal
-                logger.warn('Force to exit from downloader when crawler stop. '
-                            'Request: %s' % request, spider=spider)
-                return
-            
-        resp = self.downloader.fetch(request, spider)
-        return resp
-    
-    def _handle_download_output(self, response, request, spider):
-        assert isinstance(response, (Request, Response, type(None))), response
-        if isinstance(response, Request):
-            self.schedule_later(response, spider)
-            return
-        elif isinstance(response, type(None)):
-            return
-        
-        if self.crawler.stopped:
-                # Immediatelly exit once the crawler receive the stop signal
-                logger.warn('Force to exit from extracter when crawler stop. '
-                            'Response: %s' % response, spider=spider)
-                return
-            
-        self.extracter.enter_extracter(response, request, spider)
-    
-    
+"""
+This module implements the engine which controls
+the Scheduler, Downloader and Spider.
+"""
+import time
+
+from threaded_spider import logger
+from threaded_spider.basic.threadpool import ThreadPool    
+from threaded_spider.basic.util import load_object
+from threaded_spider.http import Request, Response
+from threaded_spider.core.scheduler import Scheduler
+from threaded_spider.core.extracter import Extracter
+from threaded_spider.core.checkpoint import save_requests
+from threaded_spider.core.warc import WarcWriter
+
+class Engine(object):
+    
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.settings = crawler.settings
+        self.downloader = load_object(self.settings.get('DOWNLOADER'))(crawler)
+        self.scheduler = Scheduler(crawler, self.downloader)
+        self.requests_to_be_scheduled = []
+        # Responses downloaded by an asynchronous downloader, waiting for
+        # the main thread to pass them to the thread pool.
+        self.downloaded = []
+        self.extracter = Extracter(crawler)
+        if self.settings.getbool('WARC_ENABLED'):
+            self.warc = WarcWriter.from_crawler(crawler)
+        else:
+            self.warc = None
+        self.thread_pool = ThreadPool(minthreads=self.settings.getint('THREAD_NUM', 7),
+                                      maxthreads=self.settings.getint('THREAD_NUM', 7),
+                                      name='engine_threadpool')
+        self.spider = None
+        self.running = False
+        self.paused = False
+        # Requests dispatched to the thread pool but not finished yet.
+        self.inflight = []
+        
+    def start(self):
+        """Start the execution engine"""
+        
+        assert not self.running, 'Engine already running.'
+        
+        self.start_time = time.time()
+        self.running = True
+        self.thread_pool.start()
+        
+    def stop(self, force=False):
+        """Stop the execution engine gracefully"""
+        
+        assert self.running, 'Engine not running.'
+        logger.info('@engine, stopping...')
+        # Workers waiting for the extracter must go on to be joined.
+        self.extracter.resume()
+        # Stop the threadpool and close spider.
+        self.thread_pool.stop()
+        self.thread_pool.dumpStats()
+        self.downloader.close()
+        self.scheduler.close()
+        if self.warc is not None:
+            self.warc.close()
+        self.detach_spider()
+        
+        self.running = False
+        logger.info('@engine, stopped.')
+        logger.info('@engine, unscheduled: %s' % len(self.requests_to_be_scheduled))
+        logger.debug('@engine, unscheduled: %r' % self.requests_to_be_scheduled)
+        logger.info('@engine, in scheduler: %s' % len(self.scheduler))
+        logger.debug('@engine, in scheduler: %r, slots(key, queued, active): %r' 
+                     % (self.scheduler.mq.queue, self.scheduler.slot_stats()[:20]))
+        logger.info('@engine, in downloader: %s' % self.downloader.has_pending_download())
+    
+    def attach_spider(self, spider, start_requests=()):
+        """Attach a spider to the engine."""
+        logger.info('@engine, Spider attached to engine.', spider=spider)
+        self.spider = spider
+        if callable(start_requests):
+            start_requests = start_requests()
+        self._start_requests = iter(start_requests)
+        
+        self.scheduler.attach_spider(spider)
+        self.extracter.attach_spider(spider)
+    
+    def detach_spider(self):
+        self.extracter.detach_spider()
+    
+    def pause(self):
+        """Stop dispatching requests and parsing responses, so that
+        the queues in downloader and item processor could drain."""
+        if self.paused:
+            return
+        self.paused = True
+        self.extracter.pause()
+        logger.info('@engine, paused.')
+    
+    def unpause(self):
+        if not self.paused:
+            return
+        self.paused = False
+        self.extracter.resume()
+        logger.info('@engine, unpaused.')
+    
+    def checkpoint(self, path):
+        """Save the requests not finished yet into a file, which could be 
+        loaded by core.checkpoint.load_requests to resume the crawl."""
+        requests = list(self.inflight)
+        requests.extend([request for request, spider in self.requests_to_be_scheduled])
+        requests.extend(self.scheduler.pending_requests())
+        if self._start_requests:
+            requests.extend(self._start_requests)
+            self._start_requests = None
+        count = save_requests(path, requests, self.spider)
+        logger.info('@engine, %d requests saved to checkpoint %s' % (count, path))
+        return count
+    
+    def queue_stats(self):
+        """Return the (name, count, bytes) tuples of the queues holding 
+        requests, responses or items, the bytes is estimated from the
+        urls and bodies."""
+        def size_of(objs):
+            return sum(len(x.url) + len(x.body) for x in objs)
+        
+        unscheduled = [request for request, spider in self.requests_to_be_scheduled]
+        scheduled = self.scheduler.pending_requests()
+        downloading = list(self.downloader.active)
+        extracting = list(self.extracter.active_response)
+        item_count, item_bytes = self.extracter.itemproc.pending_stats()
+        return [('unscheduled', len(unscheduled), size_of(unscheduled)),
+                ('scheduler', len(scheduled), size_of(scheduled)),
+                ('downloader', len(downloading), size_of(downloading)),
+                ('extracter', len(extracting), size_of(extracting)),
+                ('itemproc', item_count, item_bytes),
+                ]
+        
+    def process_next_request(self, spider):
+        self._process_next_request(spider)    
+          
+    def _process_next_request(self, spider):
+        """Grab a request object from scheduler and then download a 
+        response object which is parsed by the spider.
+        """
+        if self.paused:
+            # Dispatch nothing until unpaused.
+            self._schedule2()
+        else:
+            request = self._process_next_request_from_scheduler(spider)
+            
+            if not request and self._start_requests:
+                try:
+                    request = next(self._start_requests)
+                except StopIteration:
+                    self._start_requests = None
+                except Exception:
+                    logger.error(why='@engine, Fail to obtain request from start requests.',
+                                 spider=spider)
+                else:
+                    logger.info('@engne, schedule a request from start_urls', spider=spider)
+                    self._schedule(request, spider)
+        
+        if self.spider_is_idle(spider):
+            logger.info('@engine, Spider is idle.', spider=spider)
+            self._spider_idle(spider)
+                
+    def _process_next_request_from_scheduler(self, spider):
+        self._schedule2()
+        if self.downloader.asynchronous:
+            return self._process_next_requests_async(spider)
+        
+        request = self.scheduler.next_request()
+        if not request:
+            return
+        
+        self.inflight.append(request)
+        # Error raised by tasks in the thread pool will be logged as 
+        # `Unhandled Error` by default and not break down the main thread.    
+        self.call_in_thread_with_callback(self._make_output_handler(request, spider),
+                                          self.download, request, spider)
+        return request
+    
+    def _process_next_requests_async(self, spider):
+        """Pass the downloaded responses to the thread pool, and dispatch
+        as many requests as the downloader could accept."""
+        while self.downloaded:
+            try:
+                item = self.downloaded[0]
+                self.downloaded.remove(item)
+            except IndexError:
+                break
+            
+            response, request, spider = item
+            self.call_in_thread(self._make_output_handler(request, spider), True, response)
+        
+        request = None
+        while self.downloader.has_capacity():
+            request = self.scheduler.next_request()
+            if not request:
+                break
+            
+            self.inflight.append(request)
+            def on_downloaded(response, request=request):
+                self.scheduler.request_done(request)
+                self.downloaded.append((response, request, spider))
+            self.downloader.fetch_async(request, spider, on_downloaded)
+        return request
+    
+    def _make_output_handler(self, request, spider):
+        def handle_download_output(succeed, result):
+            try:
+                self._handle_download_output(result, request, spider)
+            finally:
+                # Keep it for the checkpoint if dropped because of stopping.
+                if not self.crawler.stopped:
+                    self.inflight.remove(request)
+        return handle_download_output
+    
+    # Sub-threads use this to schedule later instead of 
+    # operating on the scheduler queue directly.
+    def schedule_later(self, request, spider):
+        self.requests_to_be_scheduled.append((request, spider))
+    
+    # Main thread use two below to put request to the scheduler queue.
+    def _schedule(self, request, spider):
+        self.scheduler.enqueue_request(request)
+    
+    def _schedule2(self):
+        while self.requests_to_be_scheduled:
+            try:   
+                item = self.requests_to_be_scheduled[0]
+                self.requests_to_be_scheduled.remove(item)
+            except IndexError:
+                return
+        
+            request, spider = item
+            self.scheduler.enqueue_request(request)    
+        
+    def spider_is_idle(self, spider):
+        # Judge whether there is any request to be processed.
+        has_unscheduled_request = (len(self.requests_to_be_scheduled) or len(self.downloaded)
+                                   or self._start_requests is not None)
+        has_pending_request = self.scheduler.has_pending_requests()
+        has_pending_download = self.downloader.has_pending_download()
+        has_pending_response = self.extracter.has_pending_response()
+        has_pending_task = self.thread_pool.has_pending_task() 
+        return not any((has_unscheduled_request, has_pending_request, 
+                        has_pending_download, has_pending_response, 
+                        has_pending_task))
+    
+    def _spider_idle(self, spider):
+        self.crawler.stop()
+    
+    def call_in_thread(self, func, *args, **kws):
+        self.thread_pool.callInThread(func, *args, **kws)
+        
+    def call_in_thread_with_callback(self, onResult, func, *args, **kws):
+        self.thread_pool.callInThreadWithCallback(onResult, func, *args, **kws)
+        
+    def download(self, request, spider):
+        if self.crawler.stopped:
+                # Immediatelly exit once the crawler receive the stop signal
+                logger.warn('Force to exit from downloader when crawler stop. '
+                            'Request: %s' % request, spider=spider)
+                return
+            
+        try:
+            resp = self.downloader.fetch(request, spider)
+        finally:
+            self.scheduler.request_done(request)
+        return resp
+    
+    def _handle_download_output(self, response, request, spider):
+        assert isinstance(response, (Request, Response, type(None))), response
+        if isinstance(response, Request):
+            self.schedule_later(response, spider)
+            return
+        elif isinstance(response, type(None)):
+            return
+        
+        if self.crawler.stopped:
+                # Immediatelly exit once the crawler receive the stop signal
+                logger.warn('Force to exit from extracter when crawler stop. '
+                            'Response: %s' % response, spider=spider)
+                return
+        
+        if self.warc is not None:
+            try:
+                self.warc.write(response)
+            except Exception:
+                logger.error(why='@engine, fail to write %s to WARC' % response, spider=spider)
+            
+        self.extracter.enter_extracter(response, request, spider)
+    
+    
         # TODO: Store the items after parsing.
\ No newline at end of file
@@ -0,0 +1,737 @@
+"""
+Downloader running many HTTP/1.1 requests in a single thread with
+non-blocking sockets and epoll(or select where epoll is unavailable),
+instead of taking a whole thread for each download.
+
+Enable it by setting DOWNLOADER to
+'threaded_spider.core.evdownloader.EventLoopDownloader', the responses are
+still parsed by the spider in the engine threadpool.
+"""
+import os
+import sys
+import time
+import errno
+import socket
+import select
+import urlparse
+import threading
+from collections import deque
+try:
+    import ssl
+except ImportError:
+    ssl = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from threaded_spider import logger
+from threaded_spider.http import Response, Headers
+from threaded_spider.core.downloader import Downloader, HttpError, REDIRECT_STATUSES
+from threaded_spider.core.bodyreceiver import SizeLimitExceeded, ContentTypeNotAllowed
+
+READ = 1
+WRITE = 2
+MAX_HEAD_SIZE = 64 * 1024
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS)
+if ssl is not None:
+    _SSL_WANT = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
+else:
+    _SSL_WANT = ()
+
+class _Poller(object):
+    """Wrap epoll or select with the same interface."""
+
+    def __init__(self):
+        self.epoll = select.epoll() if hasattr(select, 'epoll') else None
+        self.fds = {}
+
+    def register(self, fd, events):
+        if self.epoll is not None:
+            mask = 0
+            if events & READ:
+                mask |= select.EPOLLIN
+            if events & WRITE:
+                mask |= select.EPOLLOUT
+            if fd in self.fds:
+                self.epoll.modify(fd, mask)
+            else:
+                self.epoll.register(fd, mask)
+        self.fds[fd] = events
+
+    def unregister(self, fd):
+        if self.fds.pop(fd, None) is not None and self.epoll is not None:
+            self.epoll.unregister(fd)
+
+    def poll(self, timeout):
+        """Return a list of (fd, events), an error or hang-up is reported
+        as both readable and writable so that it's found by the handler."""
+        if self.epoll is not None:
+            result = []
+            for fd, mask in self.epoll.poll(timeout):
+                events = 0
+                if mask & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP):
+                    events |= READ
+                if mask & (select.EPOLLOUT | select.EPOLLERR | select.EPOLLHUP):
+                    events |= WRITE
+                result.append((fd, events))
+            return result
+
+        readers = [fd for fd, events in self.fds.items() if events & READ]
+        writers = [fd for fd, events in self.fds.items() if events & WRITE]
+        if not readers and not writers:
+            time.sleep(timeout)
+            return []
+        r, w, x = select.select(readers, writers, readers + writers, timeout)
+        events = {}
+        for fd in r:
+            events[fd] = events.get(fd, 0) | READ
+        for fd in w:
+            events[fd] = events.get(fd, 0) | WRITE
+        for fd in x:
+            events[fd] = READ | WRITE
+        return events.items()
+
+    def close(self):
+        if self.epoll is not None:
+            self.epoll.close()
+
+class _ResponseParser(object):
+    """Parse an HTTP/1.x response incrementally as the data arrives,
+    the body is passed to a receiver created by `make_receiver(status, headers)`
+    once the head is parsed."""
+
+    def __init__(self, make_receiver, head_request=False):
+        self.make_receiver = make_receiver
+        self.head_request = head_request
+        self.status = None
+        self.reason = ''
+        self.headers = {}
+        self.receiver = None
+        self.keep_alive = False
+        self.done = False
+        self._state = 'head'
+        self._remaining = 0
+        self._buf = ''
+
+    def feed(self, data):
+        buf = self._buf + data if self._buf else data
+        while buf and not self.done:
+            state = self._state
+            if state == 'head':
+                end = buf.find('\r\n\r\n')
+                if end < 0:
+                    if len(buf) > MAX_HEAD_SIZE:
+                        raise ValueError('Response head too long')
+                    break
+                self._parse_head(buf[:end])
+                buf = buf[end + 4:]
+            elif state in ('body', 'chunk_data'):
+                data = buf[:self._remaining]
+                buf = buf[len(data):]
+                self.receiver.feed(data)
+                self._remaining -= len(data)
+                if self._remaining == 0:
+                    if state == 'body':
+                        self.done = True
+                    else:
+                        self._state = 'chunk_end'
+            elif state == 'close':
+                self.receiver.feed(buf)
+                buf = ''
+            elif state == 'chunk_end':
+                if len(buf) < 2:
+                    break
+                buf = buf[2:]
+                self._state = 'chunk_size'
+            else:
+                # chunk_size or trailer, both are lines.
+                end = buf.find('\r\n')
+                if end < 0:
+                    break
+                line, buf = buf[:end], buf[end + 2:]
+                if state == 'trailer':
+                    if not line:
+                        self.done = True
+                else:
+                    size = int(line.split(';', 1)[0].strip(), 16)
+                    if size:
+                        self._remaining = size
+                        self._state = 'chunk_data'
+                    else:
+                        self._state = 'trailer'
+        self._buf = buf
+
+    def writable(self, size):
+        """Return a view of the body to receive at most `size` bytes into,
+        or None when the data has to be parsed by `feed`."""
+        if self._state != 'body' or self._buf or self.done:
+            return None
+        return self.receiver.writable(min(size, self._remaining))
+
+    def received(self, size):
+        """Account for `size` bytes received into the view of `writable`."""
+        self.receiver.advance(size)
+        self._remaining -= size
+        if self._remaining == 0:
+            self.done = True
+
+    def feed_eof(self):
+        if self._state == 'close':
+            self.done = True
+        if not self.done:
+            raise ValueError('Connection closed before the response completed')
+
+    def _parse_head(self, head):
+        status_line, _, raw_headers = head.partition('\r\n')
+        version, status, reason = (status_line.split(None, 2) + ['', ''])[:3]
+        status = int(status)
+        if 100 <= status < 200:
+            # Such as `100 Continue`, the real response follows.
+            return
+
+        headers = Headers.from_raw(raw_headers)
+
+        self.status, self.reason, self.headers = status, reason, headers
+        self.receiver = self.make_receiver(status, headers)
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            self.keep_alive = 'close' not in connection
+        else:
+            self.keep_alive = 'keep-alive' in connection
+
+        if self.head_request or status in (204, 304):
+            self.done = True
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self._state = 'chunk_size'
+        elif 'content-length' in headers:
+            self._remaining = int(headers['content-length'])
+            self._state = 'body'
+            self.done = self._remaining == 0
+        elif status in REDIRECT_STATUSES and 'location' in headers:
+            # Some servers keep the connection open after a redirection
+            # without body length, don't wait for its body.
+            self.done = True
+            self.keep_alive = False
+        else:
+            # Read until the server closes the connection.
+            self._state = 'close'
+            self.keep_alive = False
+
+class _Fetch(object):
+    """A request being downloaded, which may go through redirections."""
+
+    def __init__(self, request, spider, callback):
+        self.request = request
+        self.spider = spider
+        self.callback = callback
+        self.url = request.url
+        self.method = request.method
+        self.headers = request.headers
+        self.body = request.body
+        self.created = time.time()
+        # The stale CacheEntry being revalidated.
+        self.cache_entry = None
+        # Timeouts and start time of the current hop.
+        self.connect_timeout = self.read_timeout = None
+        self.started = None
+
+class _Connection(object):
+
+    def __init__(self, key, hostname, sock):
+        self.key = key
+        self.hostname = hostname
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.state = 'connecting'
+        self.reused = False
+        self.received = False
+        self.fetch = None
+        self.parser = None
+        self.outbuf = ''
+        self.deadline = None
+        self.idle_since = None
+        self.resume_at = None
+
+class EventLoopDownloader(Downloader):
+
+    asynchronous = True
+
+    def __init__(self, crawler):
+        super(EventLoopDownloader, self).__init__(crawler)
+        settings = crawler.settings
+        self.max_active = settings.getint('EVLOOP_CONCURRENT_REQUESTS', 1000)
+        self.pool_maxsize = settings.getint('CONNPOOL_MAXSIZE', 10)
+        self.idle_timeout = settings.getfloat('CONNPOOL_IDLE_TIMEOUT', 30)
+        if ssl is not None:
+            self.ssl_context = ssl.create_default_context()
+        else:
+            self.ssl_context = None
+
+        self.poller = _Poller()
+        self.conns = {}
+        # Connections whose reading is paused by the bandwidth limit.
+        self.throttled = {}
+        self.idle = {}
+        if self.proxies is not None:
+            logger.warn('@evdownloader, PROXY_LIST is supported by the threaded '
+                        'downloader only, downloading directly.')
+            self.proxies = None
+        # Fetches submitted by the main thread and not started yet.
+        self.incoming = deque()
+        # (fetch, addrinfo, exc) of the fetches whose host has been resolved
+        # in the background, appended by the resolver threads.
+        self.resolved = deque()
+        self._next_timeout_check = 0
+
+        self._waker = None
+        if fcntl is not None:
+            self._waker = os.pipe()
+            for fd in self._waker:
+                flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+                fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self.poller.register(self._waker[0], READ)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='evloop_thread')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def has_capacity(self):
+        return len(self.active) < self.max_active
+
+    def fetch_async(self, request, spider, callback):
+        """Download the request in the event loop thread, `callback` is
+        called in that thread with the response or None on failure."""
+        if self._exceeds_max_depth(request):
+            callback(None)
+            return
+
+        fetch = _Fetch(request, spider, callback)
+        if self.httpcache is not None:
+            entry = self.httpcache.lookup(request)
+            if entry is not None and self.httpcache.is_fresh(entry, request):
+                callback(entry.response)
+                return
+            fetch.cache_entry = entry
+            fetch.headers = self.httpcache.conditional_headers(entry, fetch.headers)
+
+        self.active.append(request)
+        self.stats.max_value('evloop/max_active', len(self.active))
+        self.incoming.append(fetch)
+        self._wakeup()
+
+    def _wakeup(self):
+        if self._waker is not None:
+            try:
+                os.write(self._waker[1], 'x')
+            except OSError:
+                pass
+
+    def close(self):
+        self.running = False
+        self._wakeup()
+        self.thread.join()
+        for conn in self.conns.values():
+            conn.sock.close()
+        self.conns.clear()
+        self.poller.close()
+        if self._waker is not None:
+            for fd in self._waker:
+                os.close(fd)
+        super(EventLoopDownloader, self).close()
+
+    def _run(self):
+        timeout = 1.0 if self._waker is not None else 0.05
+        while self.running:
+            while self.incoming:
+                self._start_fetch(self.incoming.popleft())
+            while self.resolved:
+                fetch, addrinfo, exc = self.resolved.popleft()
+                if exc is None:
+                    self._start_fetch(fetch, addrinfo[0])
+                else:
+                    self._fetch_failed(fetch, exc)
+
+            poll_timeout = timeout
+            if self.throttled:
+                resume_at = min(conn.resume_at for conn in self.throttled.values())
+                poll_timeout = min(timeout, max(0, resume_at - time.time()))
+            try:
+                events = self.poller.poll(poll_timeout)
+            except (IOError, OSError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, flags in events:
+                if self._waker is not None and fd == self._waker[0]:
+                    self._drain_waker()
+                    continue
+
+                conn = self.conns.get(fd)
+                if conn is None:
+                    continue
+                try:
+                    self._handle_event(conn, flags)
+                except Exception:
+                    self._fail(conn)
+            if self.throttled:
+                self._resume_throttled()
+            self._check_timeouts()
+
+    def _drain_waker(self):
+        try:
+            while os.read(self._waker[0], 4096):
+                pass
+        except OSError:
+            pass
+
+    def _start_fetch(self, fetch, address=None):
+        """Start the fetch on an idle connection or a new one to `address`,
+        a getaddrinfo entry, looked up in the dns cache if not given."""
+        try:
+            scheme, netloc, path, query, _ = urlparse.urlsplit(fetch.url)
+            host = netloc.rpartition('@')[2].lower()
+            key = (scheme, host)
+            conn = self._idle_connection(key)
+            if conn is None:
+                conn = self._connect(key, fetch, address)
+                if conn is None:
+                    # Started again once the host is resolved.
+                    return
+                self.stats.inc_value('evloop/new_connections')
+            else:
+                self.stats.inc_value('evloop/reused_connections')
+            self._update_reuse_ratio()
+
+            path = path or '/'
+            if query:
+                path = '%s?%s' % (path, query)
+            conn.fetch = fetch
+            url = fetch.url
+            conn.parser = _ResponseParser(
+                lambda status, headers: self._receiver(fetch.request, url, status, headers),
+                fetch.method == 'HEAD')
+            conn.outbuf = self._build_request(fetch, host, path)
+            conn.received = False
+            fetch.connect_timeout, fetch.read_timeout = self.timeouts.get(fetch.request, host)
+            fetch.started = time.time()
+            if conn.state == 'idle':
+                conn.state = 'sending'
+                conn.deadline = fetch.started + fetch.read_timeout
+                self.poller.register(conn.fd, WRITE)
+            else:
+                conn.deadline = fetch.started + fetch.connect_timeout
+        except Exception:
+            self._fetch_failed(fetch)
+
+    def _build_request(self, fetch, host, path):
+        headers = self._default_headers(fetch.headers)
+        body = fetch.body or ''
+        if body or fetch.method in ('POST', 'PUT'):
+            headers['Content-Length'] = len(body)
+
+        lines = ['%s %s HTTP/1.1' % (fetch.method, path), 'Host: %s' % host]
+        lines.extend('%s: %s' % (name, value) for name, value in headers.items())
+        return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+    def idle_connections(self, host):
+        return sum(len(self.idle.get((scheme, host), ())) for scheme in DEFAULT_PORTS)
+
+    def _idle_connection(self, key):
+        conns = self.idle.get(key)
+        while conns:
+            conn = conns.pop()
+            if time.time() - conn.idle_since <= self.idle_timeout:
+                conn.reused = True
+                return conn
+            self._close(conn)
+        return None
+
+    def _update_reuse_ratio(self):
+        reused = self.stats.get_value('evloop/reused_connections', 0)
+        total = reused + self.stats.get_value('evloop/new_connections', 0)
+        self.stats.set_value('evloop/reuse_ratio', round(float(reused) / total, 3))
+
+    def _connect(self, key, fetch, address=None):
+        """Return a new connection, or None if the host isn't resolved yet,
+        then the fetch is started again when it is."""
+        scheme, host = key
+        if scheme not in DEFAULT_PORTS:
+            raise ValueError('Unsupported url scheme: %s' % scheme)
+        parts = urlparse.urlsplit('//' + host)
+        hostname, port = parts.hostname, parts.port or DEFAULT_PORTS[scheme]
+
+        if address is None:
+            addrinfo = self.pool.dnscache.cached_addrinfo(hostname, port)
+            if addrinfo is None:
+                self._resolve(fetch, hostname, port)
+                return None
+            address = addrinfo[0]
+        family, socktype, proto, _, address = address
+        sock = socket.socket(family, socktype, proto)
+        sock.setblocking(0)
+        err = sock.connect_ex(address)
+        if err and err not in _WOULD_BLOCK:
+            sock.close()
+            raise socket.error(err, os.strerror(err))
+
+        conn = _Connection(key, hostname, sock)
+        self.conns[conn.fd] = conn
+        self.poller.register(conn.fd, WRITE)
+        return conn
+
+    def _resolve(self, fetch, hostname, port):
+        # Never in this thread, a blocking getaddrinfo would stall all the
+        # other fetches.
+        def resolved(addrinfo, exc):
+            self.resolved.append((fetch, addrinfo, exc))
+            self._wakeup()
+        self.stats.inc_value('evloop/dns_waits')
+        self.pool.dnscache.resolve_async(hostname, port, resolved)
+
+    def _handle_event(self, conn, flags):
+        if conn.state == 'idle':
+            # Data or EOF on an idle connection, the server has closed it.
+            self._close(conn)
+            return
+
+        if conn.state == 'connecting':
+            err = conn.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise socket.error(err, os.strerror(err))
+            if conn.key[0] == 'https':
+                if self.ssl_context is None:
+                    raise ValueError('ssl module unavailable for %s' % conn.fetch.url)
+                conn.sock = self.ssl_context.wrap_socket(conn.sock,
+                                                         server_hostname=conn.hostname,
+                                                         do_handshake_on_connect=False)
+                conn.state = 'handshaking'
+            else:
+                conn.state = 'sending'
+                conn.deadline = time.time() + conn.fetch.read_timeout
+
+        if conn.state == 'handshaking':
+            try:
+                conn.sock.do_handshake()
+            except ssl.SSLWantReadError:
+                self.poller.register(conn.fd, READ)
+                return
+            except ssl.SSLWantWriteError:
+                self.poller.register(conn.fd, WRITE)
+                return
+            conn.state = 'sending'
+            conn.deadline = time.time() + conn.fetch.read_timeout
+
+        if conn.state == 'sending':
+            self._send(conn)
+        elif conn.state == 'reading' and flags & READ:
+            self._recv(conn)
+
+    def _send(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except _SSL_WANT:
+            return
+        except socket.error, e:
+            if e.args[0] in _WOULD_BLOCK:
+                return
+            raise
+
+        conn.outbuf = conn.outbuf[sent:]
+        if conn.outbuf:
+            self.poller.register(conn.fd, WRITE)
+        else:
+            conn.state = 'reading'
+            self.poller.register(conn.fd, READ)
+
+    def _recv(self, conn):
+        while True:
+            view = conn.parser.writable(self.read_size)
+            try:
+                if view is not None:
+                    # Straight into the preallocated body.
+                    data, size = None, conn.sock.recv_into(view)
+                else:
+                    data = conn.sock.recv(self.read_size)
+                    size = len(data)
+            except _SSL_WANT:
+                return
+            except socket.error, e:
+                if e.args[0] in _WOULD_BLOCK:
+                    return
+                raise
+            finally:
+                # Let the body be resized when cut short.
+                view = None
+
+            if not size:
+                conn.parser.feed_eof()
+                conn.parser.keep_alive = False
+                self._finish(conn)
+                return
+
+            conn.received = True
+            now = time.time()
+            conn.deadline = now + conn.fetch.read_timeout
+            if data is None:
+                conn.parser.received(size)
+            else:
+                conn.parser.feed(data)
+            if conn.parser.done:
+                self._finish(conn)
+                return
+
+            wait = self.bandwidth.consume(conn.key[1], size)
+            if wait > 0:
+                # Stop reading until the bucket refills.
+                self.poller.unregister(conn.fd)
+                conn.resume_at = now + wait
+                conn.deadline += wait
+                self.throttled[conn.fd] = conn
+                return
+
+    def _resume_throttled(self):
+        now = time.time()
+        for fd, conn in self.throttled.items():
+            if conn.resume_at > now:
+                continue
+            del self.throttled[fd]
+            self.poller.register(fd, READ)
+            try:
+                # TLS may have buffered data which won't wake up the poller.
+                self._recv(conn)
+            except Exception:
+                self._fail(conn)
+
+    def _finish(self, conn):
+        fetch, parser = conn.fetch, conn.parser
+        conn.fetch = conn.parser = None
+        conn.deadline = None
+        idle = self.idle.setdefault(conn.key, [])
+        if parser.keep_alive and len(idle) < self.pool_maxsize:
+            conn.state = 'idle'
+            conn.idle_since = time.time()
+            idle.append(conn)
+            self.poller.register(conn.fd, READ)
+        else:
+            self._close(conn)
+
+        self.timeouts.record(conn.key[1], time.time() - fetch.started)
+        try:
+            self._handle_response(fetch, parser)
+        except Exception:
+            self._fetch_failed(fetch)
+
+    def _handle_response(self, fetch, parser):
+        status, headers = parser.status, parser.headers
+        location = headers.get('location')
+        if (status in REDIRECT_STATUSES and location and
+                not fetch.request.meta.get('dont_redirect')):
+            target = self._redirect_target(fetch.request, fetch.url, status, location,
+                                           fetch.method, fetch.body)
+            if target is None:
+                self.breaker.record_result(fetch.request)
+                self._complete(fetch, None)
+                return
+            fetch.url, fetch.method, fetch.body = target
+            self._start_fetch(fetch)
+            return
+
+        if status >= 400:
+            raise HttpError(fetch.url, status, parser.reason)
+
+        receiver = parser.receiver
+        response = Response._from_trusted(fetch.url, status=status,
+                                          headers=receiver.decode_headers(headers),
+                                          body=self._body(receiver), request=fetch.request)
+        if self.httpcache is not None:
+            response = self.httpcache.process_response(fetch.request, response,
+                                                       fetch.cache_entry)
+        self.breaker.record_result(fetch.request)
+        self.autothrottle.response_received(fetch.request, status,
+                                            time.time() - fetch.created)
+        self._complete(fetch, response)
+
+    def _fail(self, conn):
+        """Called in an except clause when the connection breaks down."""
+        fetch = conn.fetch
+        self._close(conn)
+        if fetch is None:
+            return
+
+        if conn.reused and not conn.received:
+            # The server may have closed the idle connection, so try again.
+            self.stats.inc_value('evloop/stale_reconnects')
+            self._start_fetch(fetch)
+            return
+        self._fetch_failed(fetch)
+
+    def _fetch_failed(self, fetch, exc=None):
+        """Complete the fetch with a retry request or None, called in an
+        except clause unless `exc` is given."""
+        if exc is None:
+            exc = sys.exc_info()[1]
+        self.breaker.record_result(fetch.request, exc)
+        if isinstance(exc, SizeLimitExceeded):
+            self.stats.inc_value('downloader/maxsize_exceeded')
+            logger.warn('@evdownloader, fetch %s aborted: %s' % (fetch.request, exc),
+                        spider=fetch.spider)
+            self._complete(fetch, None)
+            return
+        if isinstance(exc, ContentTypeNotAllowed):
+            self.stats.inc_value('downloader/content_type_aborted')
+            logger.debug('@evdownloader, fetch %s aborted: %s' % (fetch.request, exc),
+                         spider=fetch.spider)
+            self._complete(fetch, None)
+            return
+
+        self.autothrottle.download_failed(fetch.request, exc)
+        retry = self.retry.retry_request(fetch.request, exc, fetch.spider)
+        if retry is None:
+            if sys.exc_info()[1] is exc:
+                logger.error(why='@evdownloader, fetch %s failed' % fetch.request,
+                             spider=fetch.spider)
+            else:
+                logger.warn('@evdownloader, fetch %s failed: %s' % (fetch.request, exc),
+                            spider=fetch.spider)
+        self._complete(fetch, retry)
+
+    def _check_timeouts(self):
+        now = time.time()
+        if now < self._next_timeout_check:
+            return
+        self._next_timeout_check = now + 0.5
+
+        for conn in self.conns.values():
+            if conn.state == 'idle':
+                if now - conn.idle_since > self.idle_timeout:
+                    self._close(conn)
+            elif conn.deadline is not None and now > conn.deadline:
+                fetch = conn.fetch
+                self._close(conn)
+                self.stats.inc_value('downloader/timeouts')
+                self._fetch_failed(fetch, socket.timeout('%s timed out in %s'
+                                                         % (fetch.url, conn.state)))
+
+    def _close(self, conn):
+        self.poller.unregister(conn.fd)
+        self.conns.pop(conn.fd, None)
+        self.throttled.pop(conn.fd, None)
+        idle = self.idle.get(conn.key)
+        if idle and conn in idle:
+            idle.remove(conn)
+        conn.sock.close()
+
+    def _complete(self, fetch, response):
+        try:
+            fetch.callback(response)
+        except Exception:
+            logger.error(why='@evdownloader, callback for %s failed' % fetch.request,
+                         spider=fetch.spider)
+        finally:
+            # Only once handed over, the engine mustn't see the request
+            # neither active nor downloaded and stop.
+            self.active.remove(fetch.request)
@@ -0,0 +1,261 @@
+"""
+Cache the responses on disk keyed by request fingerprint, so that re-running
+a spider doesn't download the same pages again.
+
+A cached response considered fresh by the policy is returned without any
+network access, a stale one is revalidated with If-None-Match and
+If-Modified-Since, and its body is reused when the server answers 304.
+"""
+from __future__ import with_statement
+
+import os
+import time
+import errno
+import cPickle as pickle
+from email.utils import parsedate_tz, mktime_tz
+
+from threaded_spider import logger
+from threaded_spider.basic.util import load_object
+from threaded_spider.http import Response, Headers
+from threaded_spider.http.common import request_fingerprint
+
+# Headers of a 304 response which must not replace the cached ones.
+IGNORED_304_HEADERS = ('content-length', 'content-encoding', 'transfer-encoding')
+
+# Statuses cacheable without explicit freshness information, see RFC 2616 13.4.
+HEURISTIC_CACHEABLE_STATUSES = (200, 203, 300, 301, 308, 410)
+
+def parse_cache_control(header):
+    """Parse a Cache-Control header into a dict of directive -> value or None."""
+    directives = {}
+    for directive in header.split(','):
+        name, sep, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') if sep else None
+    return directives
+
+def http_date_to_timestamp(value):
+    try:
+        return mktime_tz(parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+class CacheEntry(object):
+    """A stored response and the time it was stored or revalidated."""
+
+    def __init__(self, response, timestamp):
+        self.response = response
+        self.timestamp = timestamp
+
+class DummyPolicy(object):
+    """Cache every response and never revalidate it, which is handy while
+    developing a spider. Entries only expire by HTTPCACHE_EXPIRATION_SECS."""
+
+    def __init__(self, settings):
+        self.ignore_http_codes = set(int(x) for x in
+                                     settings.get('HTTPCACHE_IGNORE_HTTP_CODES', ()))
+
+    def should_cache_request(self, request):
+        return request.method in ('GET', 'HEAD')
+
+    def should_cache_response(self, response, request):
+        return response.status not in self.ignore_http_codes
+
+    def is_fresh(self, entry, request):
+        return True
+
+class RFC2616Policy(DummyPolicy):
+    """Follow the Cache-Control, Expires, Date and Last-Modified headers."""
+
+    # The fraction of the time since Last-Modified a response is considered
+    # fresh without explicit expiration time, see RFC 7234 4.2.2.
+    heuristic_fraction = 0.1
+
+    def should_cache_request(self, request):
+        if not super(RFC2616Policy, self).should_cache_request(request):
+            return False
+        cc = parse_cache_control(self._header(request.headers, 'cache-control'))
+        return 'no-store' not in cc
+
+    def should_cache_response(self, response, request):
+        if not super(RFC2616Policy, self).should_cache_response(response, request):
+            return False
+        headers = response.headers
+        cc = parse_cache_control(headers.get('cache-control', ''))
+        if 'no-store' in cc:
+            return False
+        if response.status in HEURISTIC_CACHEABLE_STATUSES:
+            return True
+        return bool('max-age' in cc or headers.get('expires') or
+                    headers.get('etag') or headers.get('last-modified'))
+
+    def is_fresh(self, entry, request):
+        request_cc = parse_cache_control(self._header(request.headers, 'cache-control'))
+        headers = entry.response.headers
+        cc = parse_cache_control(headers.get('cache-control', ''))
+        if 'no-cache' in request_cc or 'no-cache' in cc:
+            return False
+
+        lifetime = self._freshness_lifetime(headers, cc, entry.timestamp)
+        if 'max-age' in request_cc:
+            try:
+                lifetime = min(lifetime, int(request_cc['max-age']))
+            except (TypeError, ValueError):
+                pass
+
+        try:
+            age = max(0, int(headers.get('age', 0)))
+        except ValueError:
+            age = 0
+        age += max(0, time.time() - entry.timestamp)
+        return age < lifetime
+
+    def _freshness_lifetime(self, headers, cc, timestamp):
+        try:
+            return int(cc['max-age'])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+        date = http_date_to_timestamp(headers.get('date')) or timestamp
+        expires = headers.get('expires')
+        if expires:
+            # An invalid Expires like "0" means already expired.
+            return max(0, (http_date_to_timestamp(expires) or 0) - date)
+
+        last_modified = http_date_to_timestamp(headers.get('last-modified'))
+        if last_modified is not None and last_modified <= date:
+            return (date - last_modified) * self.heuristic_fraction
+        return 0
+
+    def _header(self, headers, name):
+        for key, value in headers.items():
+            if key.lower() == name:
+                return value
+        return ''
+
+class FilesystemCacheStorage(object):
+    """
+    Store each response in a directory named by the request fingerprint
+    under `cachedir`, with a pickled `meta` file and the raw `body`.
+    """
+
+    def __init__(self, cachedir, expiration_secs=0):
+        self.cachedir = cachedir
+        self.expiration_secs = expiration_secs
+
+    def _entry_dir(self, request):
+        fp = request_fingerprint(request)
+        return os.path.join(self.cachedir, fp[:2], fp)
+
+    def retrieve(self, request):
+        """Return the CacheEntry of the request, or None if there isn't
+        one or it has expired."""
+        path = self._entry_dir(request)
+        try:
+            with open(os.path.join(path, 'meta'), 'rb') as f:
+                meta = pickle.load(f)
+            with open(os.path.join(path, 'body'), 'rb') as f:
+                body = f.read()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+        timestamp = meta['timestamp']
+        if self.expiration_secs and time.time() - timestamp > self.expiration_secs:
+            return None
+        # A dict in the entries stored before the headers kept repeated ones.
+        response = Response._from_trusted(meta['url'], status=meta['status'],
+                                          headers=Headers(meta['headers']), body=body,
+                                          request=request)
+        return CacheEntry(response, timestamp)
+
+    def store(self, request, response, timestamp=None):
+        path = self._entry_dir(request)
+        try:
+            os.makedirs(path)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        meta = {'url': response.url, 'status': response.status,
+                'headers': response.headers.multi_items(), 'request_url': request.url,
+                'method': request.method, 'timestamp': timestamp or time.time()}
+        # Write to temporary files then rename, so that another thread
+        # never reads a partial entry.
+        suffix = '.%d.%d' % (os.getpid(), id(response))
+        for name, data in (('body', response.body),
+                           ('meta', pickle.dumps(meta, pickle.HIGHEST_PROTOCOL))):
+            tmp = os.path.join(path, name + suffix)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, os.path.join(path, name))
+
+class HttpCache(object):
+    """Glue the storage and the policy for the downloaders."""
+
+    def __init__(self, storage, policy, stats=None):
+        self.storage = storage
+        self.policy = policy
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        storage = FilesystemCacheStorage(
+            settings.get('HTTPCACHE_DIR', '.httpcache'),
+            settings.getint('HTTPCACHE_EXPIRATION_SECS', 0))
+        policy = load_object(settings.get('HTTPCACHE_POLICY'))(settings)
+        logger.info('@httpcache, enabled, dir: %s, policy: %s'
+                    % (storage.cachedir, type(policy).__name__))
+        return cls(storage, policy, crawler.stats)
+
+    def _inc_stats(self, key):
+        if self.stats:
+            self.stats.inc_value('httpcache/%s' % key)
+
+    def lookup(self, request):
+        """Return the CacheEntry of the request or None."""
+        if not self.policy.should_cache_request(request):
+            return None
+        entry = self.storage.retrieve(request)
+        self._inc_stats('miss' if entry is None else 'hit')
+        return entry
+
+    def is_fresh(self, entry, request):
+        """Whether the cached response can be used without revalidation."""
+        if self.policy.is_fresh(entry, request):
+            self._inc_stats('fresh')
+            return True
+        return False
+
+    def conditional_headers(self, entry, headers):
+        """Return the request headers with the validators of a stale entry."""
+        headers = dict(headers)
+        if entry is None:
+            return headers
+        cached_headers = entry.response.headers
+        if cached_headers.get('etag'):
+            headers['If-None-Match'] = cached_headers['etag']
+        if cached_headers.get('last-modified'):
+            headers['If-Modified-Since'] = cached_headers['last-modified']
+        return headers
+
+    def process_response(self, request, response, entry=None):
+        """Store the downloaded response and return the response to use,
+        which is the cached one if the server answers 304."""
+        if response.status == 304 and entry is not None:
+            self._inc_stats('revalidated')
+            cached = entry.response
+            headers = cached.headers.copy()
+            headers.update([(name, value) for name, value in response.headers.multi_items()
+                            if name not in IGNORED_304_HEADERS])
+            response = cached.replace(headers=headers)
+            self.storage.store(request, response)
+            return response
+
+        if self.policy.should_cache_request(request) and \
+                self.policy.should_cache_response(response, request):
+            self._inc_stats('store')
+            self.storage.store(request, response)
+        else:
+            self._inc_stats('uncacheable')
+        return response
@@ -0,0 +1,107 @@
+"""
+The memory watchdog samples the resident memory of the process and reacts
+before the box starts swapping.
+
+When the RSS exceeds MEMWATCH_SOFT_LIMIT_MB, the engine is paused, no more
+requests are dispatched and no more responses are parsed, so that the
+in-flight downloads and the item processor queues could drain. When it
+exceeds MEMWATCH_HARD_LIMIT_MB, the unfinished requests are saved to
+CHECKPOINT_FILE and the crawler is stopped.
+"""
+from __future__ import with_statement
+
+import os
+import time
+
+from threaded_spider import logger
+
+STATM_PATH = '/proc/self/statm'
+MB = 1024 * 1024
+
+def get_rss():
+    """Return the resident memory of this process in bytes, or None if
+    it's unavailable on this platform."""
+    try:
+        with open(STATM_PATH) as f:
+            resident_pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+class MemoryWatchdog(object):
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.soft_limit = settings.getint('MEMWATCH_SOFT_LIMIT_MB', 0) * MB
+        self.hard_limit = settings.getint('MEMWATCH_HARD_LIMIT_MB', 0) * MB
+        self.interval = settings.getfloat('MEMWATCH_INTERVAL', 1)
+        self.checkpoint_file = settings.get('CHECKPOINT_FILE')
+        self.enabled = bool(self.soft_limit or self.hard_limit)
+        self.peak = 0
+        self._next_check = 0
+
+        if self.enabled and get_rss() is None:
+            logger.warn('@memwatch, %s is unavailable, memory watchdog disabled.'
+                        % STATM_PATH)
+            self.enabled = False
+
+    def check(self):
+        """Called by the main thread in every scheduling cycle."""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.interval
+
+        rss = get_rss()
+        if rss is None:
+            return
+        self.peak = max(self.peak, rss)
+
+        engine = self.crawler.engine
+        if self.hard_limit and rss > self.hard_limit:
+            self._on_hard_limit(rss)
+        elif self.soft_limit and rss > self.soft_limit:
+            if not engine.paused:
+                logger.warn('@memwatch, RSS %.1fMB exceeds the soft limit %.1fMB, '
+                            'pausing the engine.\n%s'
+                            % (rss / float(MB), self.soft_limit / float(MB), self.report()))
+                engine.pause()
+            elif not self._drainable():
+                # Python seldom gives freed memory back to the system,
+                # so go on if the queues are already drained.
+                logger.warn('@memwatch, RSS %.1fMB still exceeds the soft limit '
+                            'after the queues drained, unpausing the engine.'
+                            % (rss / float(MB)))
+                engine.unpause()
+                self._next_check = now + self.interval * 10
+        elif engine.paused:
+            logger.info('@memwatch, RSS %.1fMB under the soft limit, unpausing the engine.'
+                        % (rss / float(MB)))
+            engine.unpause()
+
+    def _drainable(self):
+        for name, count, size in self.crawler.engine.queue_stats():
+            if name in ('downloader', 'itemproc') and count:
+                return True
+        return False
+
+    def _on_hard_limit(self, rss):
+        logger.warn('@memwatch, RSS %.1fMB exceeds the hard limit %.1fMB, '
+                    'stopping the crawler.\n%s'
+                    % (rss / float(MB), self.hard_limit / float(MB), self.report()))
+        self.crawler.stop(force=True)
+        if self.checkpoint_file:
+            self.crawler.engine.checkpoint(self.checkpoint_file)
+        else:
+            logger.warn('@memwatch, CHECKPOINT_FILE not set, unfinished requests are lost.')
+
+    def report(self):
+        """Describe the queues, the one holding the most memory first."""
+        stats = sorted(self.crawler.engine.queue_stats(), key=lambda x: x[2], reverse=True)
+        lines = ['    %-12s %8d objects %10.1fKB' % (name, count, size / 1024.0)
+                 for name, count, size in stats]
+        return 'Queues by estimated size:\n' + '\n'.join(lines)
@@ -0,0 +1,147 @@
+"""
+Spread the downloads across a pool of HTTP proxies, by the health and
+the load of each proxy.
+
+Every proxy has a health score, a moving average of the outcome of its
+downloads, where the connection errors and the statuses in PROXY_BAN_CODES
+count as failures. A proxy whose score falls below PROXY_EJECT_SCORE is
+ejected for PROXY_EJECT_TIME seconds, doubled for every ejection in a row,
+and re-admitted on probation afterwards. A download takes the proxy with
+the least active downloads for its score, at most PROXY_MAX_CONCURRENCY
+at once on a proxy, and waits if all of them are busy.
+"""
+from __future__ import with_statement
+
+import time
+import base64
+import random
+import urlparse
+import threading
+
+from threaded_spider import logger
+
+# Weight of the latest outcome in the health score.
+SCORE_ALPHA = 0.2
+# Maximum seconds a proxy stays ejected.
+MAX_EJECT_TIME = 3600
+
+class Proxy(object):
+
+    def __init__(self, url):
+        parts = urlparse.urlsplit(url if '://' in url else 'http://' + url)
+        self.url = url
+        self.netloc = parts.netloc.rpartition('@')[2]
+        self.auth = None
+        if parts.username:
+            credentials = '%s:%s' % (urlparse.unquote(parts.username),
+                                     urlparse.unquote(parts.password or ''))
+            self.auth = 'Basic ' + base64.b64encode(credentials)
+        self.score = 1.0
+        self.active = 0
+        self.ejected_until = 0
+        self.ejections = 0
+
+    def __str__(self):
+        return self.netloc
+
+    __repr__ = __str__
+
+class ProxyPool(object):
+
+    def __init__(self, proxies, max_concurrency=8, eject_score=0.5, eject_time=60,
+                 ban_codes=(), stats=None):
+        self.proxies = [Proxy(url) for url in proxies]
+        self.max_concurrency = max_concurrency
+        self.eject_score = eject_score
+        self.eject_time = eject_time
+        self.ban_codes = frozenset(ban_codes)
+        self.stats = stats
+        self._cond = threading.Condition(threading.Lock())
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(settings.get('PROXY_LIST', []),
+                   max_concurrency=settings.getint('PROXY_MAX_CONCURRENCY', 8),
+                   eject_score=settings.getfloat('PROXY_EJECT_SCORE', 0.5),
+                   eject_time=settings.getfloat('PROXY_EJECT_TIME', 60),
+                   ban_codes=settings.get('PROXY_BAN_CODES', []),
+                   stats=crawler.stats)
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def _readmit(self, now):
+        for proxy in self.proxies:
+            if proxy.ejected_until and proxy.ejected_until <= now:
+                proxy.ejected_until = 0
+                # On probation, two failures in a row eject it again.
+                proxy.score = (self.eject_score + 1.0) / 2
+                self._inc_stats('proxypool/readmitted')
+                logger.info('@proxypool, %s re-admitted' % proxy)
+
+    def _choose(self):
+        candidates = [proxy for proxy in self.proxies if not proxy.ejected_until and
+                      (not self.max_concurrency or proxy.active < self.max_concurrency)]
+        if not candidates:
+            if any(not proxy.ejected_until for proxy in self.proxies):
+                return None
+            # All of them are ejected, better try the one back soonest
+            # than stop crawling.
+            candidates = [min(self.proxies, key=lambda p: p.ejected_until)]
+        random.shuffle(candidates)
+        return min(candidates, key=lambda p: (p.active + 1) / max(p.score, 0.01))
+
+    def acquire(self):
+        """Return the proxy for a download, waiting until one is free,
+        it must be given back by `release`."""
+        with self._cond:
+            waited = False
+            while True:
+                now = time.time()
+                self._readmit(now)
+                proxy = self._choose()
+                if proxy is not None:
+                    break
+                waited = True
+                # Wake up for the next re-admission at the latest.
+                self._cond.wait(1.0)
+            proxy.active += 1
+        if waited:
+            self._inc_stats('proxypool/waits')
+        self._inc_stats('proxypool/requests')
+        return proxy
+
+    def release(self, proxy, healthy):
+        """Give back the proxy with the outcome of the download."""
+        with self._cond:
+            proxy.active -= 1
+            proxy.score += SCORE_ALPHA * ((1.0 if healthy else 0.0) - proxy.score)
+            ejected = False
+            if healthy:
+                proxy.ejections = 0
+            elif not proxy.ejected_until and proxy.score < self.eject_score:
+                proxy.ejections += 1
+                eject_time = min(MAX_EJECT_TIME, self.eject_time * 2 ** (proxy.ejections - 1))
+                proxy.ejected_until = time.time() + eject_time
+                ejected = True
+            self._cond.notify()
+
+        if not healthy:
+            self._inc_stats('proxypool/failures')
+        if ejected:
+            self._inc_stats('proxypool/ejected')
+            logger.warn('@proxypool, %s ejected for %.1fs, health score %.2f'
+                        % (proxy, eject_time, proxy.score))
+        if self.stats:
+            self.stats.set_value('proxypool/healthy',
+                                 sum(1 for p in self.proxies if not p.ejected_until))
+
+    def _inc_stats(self, key):
+        if self.stats:
+            self.stats.inc_value(key)
+
+    def proxy_stats(self):
+        """Return the (proxy, score, active, ejected) tuples of the proxies."""
+        return [(str(p), round(p.score, 3), p.active, bool(p.ejected_until))
+                for p in self.proxies]
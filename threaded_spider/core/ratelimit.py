@@ -0,0 +1,128 @@
+"""
+Token buckets limiting the rate of requests and the bandwidth of the
+crawler, globally and per host.
+
+The scheduler holds back the requests of a host until a token is
+available, and the downloaders consume a token per byte as each chunk is
+read from the socket, pausing the read until the bucket refills, so that
+the bandwidth is shaped smoothly during a download.
+"""
+from __future__ import with_statement
+
+import time
+import threading
+
+# Seconds between two reports of the measured rates to the stats.
+REPORT_INTERVAL = 1
+# Seconds between two scans for the per host buckets to drop.
+GC_INTERVAL = 60
+
+class TokenBucket(object):
+    """
+    `rate` tokens are added every second up to `burst`. Consuming more
+    tokens than available leaves the bucket in debt, the caller is expected
+    to wait until it's paid off.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.time()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount=1, now=None):
+        """Return the seconds until `amount` tokens are available."""
+        self._refill(now or time.time())
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now=None):
+        """Take the tokens and return the seconds to wait for paying off the debt."""
+        self._refill(now or time.time())
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def is_full(self, now=None):
+        self._refill(now or time.time())
+        return self.tokens >= self.burst
+
+class RateLimiter(object):
+    """
+    A global bucket and a bucket per host, either of them is disabled
+    when its rate is 0. The rate measured over the last second is set to
+    the stat ratelimit/<name>_per_sec.
+    """
+
+    def __init__(self, rate=0, host_rate=0, name='requests', stats=None, burst=None):
+        self.rate = rate
+        self.host_rate = host_rate
+        self.name = name
+        self.stats = stats
+        self.bucket = TokenBucket(rate, burst and max(burst, rate)) if rate else None
+        self.host_buckets = {}
+        self._host_burst = host_rate and max(burst or 0, host_rate)
+        self._lock = threading.Lock()
+        self._consumed = 0
+        self._next_report = time.time() + REPORT_INTERVAL
+        self._next_gc = time.time() + GC_INTERVAL
+
+    @property
+    def enabled(self):
+        return bool(self.rate or self.host_rate)
+
+    def _host_bucket(self, host):
+        bucket = self.host_buckets.get(host)
+        if bucket is None:
+            bucket = self.host_buckets[host] = TokenBucket(self.host_rate, self._host_burst)
+        return bucket
+
+    def wait_time(self, host, amount=1):
+        """Return the seconds until `amount` tokens are available for host."""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        wait = 0
+        with self._lock:
+            if self.bucket is not None:
+                wait = self.bucket.wait_time(amount, now)
+            if self.host_rate:
+                wait = max(wait, self._host_bucket(host).wait_time(amount, now))
+        return wait
+
+    def consume(self, host, amount=1):
+        """Take `amount` tokens for host and return the seconds to wait."""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        wait = 0
+        with self._lock:
+            if self.bucket is not None:
+                wait = self.bucket.consume(amount, now)
+            if self.host_rate:
+                wait = max(wait, self._host_bucket(host).consume(amount, now))
+            self._consumed += amount
+            if now >= self._next_report:
+                self._report(now)
+        return wait
+
+    def _report(self, now):
+        elapsed = now - self._next_report + REPORT_INTERVAL
+        if self.stats:
+            self.stats.set_value('ratelimit/%s_per_sec' % self.name,
+                                 round(self._consumed / elapsed, 1))
+        self._consumed = 0
+        self._next_report = now + REPORT_INTERVAL
+        if now >= self._next_gc:
+            # A full bucket is the same as a new one.
+            self._next_gc = now + GC_INTERVAL
+            for host, bucket in self.host_buckets.items():
+                if bucket.is_full(now):
+                    del self.host_buckets[host]
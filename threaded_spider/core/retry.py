@@ -0,0 +1,82 @@
+"""
+Retry the downloads failed by transient errors, such as timeouts, broken
+connections and 5xx responses.
+
+A retry is a copy of the request with `not_before` in its meta, which is
+scheduled again and held by the scheduler until then, so that the backoff
+doesn't take a thread.
+"""
+import time
+import random
+import socket
+import httplib
+
+from threaded_spider import logger
+
+class RetryPolicy(object):
+
+    transient_errors = (socket.error, httplib.HTTPException)
+
+    def __init__(self, max_retries=2, http_codes=(500, 502, 503, 504, 408, 429),
+                 backoff_base=1.0, backoff_max=60.0, enabled=True, stats=None):
+        self.max_retries = max_retries
+        self.http_codes = set(http_codes)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.enabled = enabled
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(max_retries=settings.getint('RETRY_TIMES', 2),
+                   http_codes=[int(x) for x in settings.get('RETRY_HTTP_CODES', ())],
+                   backoff_base=settings.getfloat('RETRY_BACKOFF_BASE', 1),
+                   backoff_max=settings.getfloat('RETRY_BACKOFF_MAX', 60),
+                   enabled=settings.getbool('RETRY_ENABLED', True),
+                   stats=crawler.stats)
+
+    def failure_reason(self, exc):
+        """Return a short name of the error if it's transient, else None."""
+        status = getattr(exc, 'status', None)
+        if status is not None:
+            return 'http_%d' % status if status in self.http_codes else None
+        if isinstance(exc, socket.timeout):
+            return 'timeout'
+        if isinstance(exc, self.transient_errors):
+            return type(exc).__name__
+        return None
+
+    def backoff(self, retries):
+        """Seconds to wait before the retry, doubled each time with jitter."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (retries - 1))
+        return delay * random.uniform(0.75, 1.25)
+
+    def retry_request(self, request, exc, spider=None):
+        """Return a copy of the request to be downloaded again later,
+        or None if it shouldn't be retried."""
+        if not self.enabled or request.meta.get('dont_retry'):
+            return None
+        reason = self.failure_reason(exc)
+        if reason is None:
+            return None
+
+        retries = request.meta.get('retry_times', 0) + 1
+        max_retries = request.meta.get('max_retry_times', self.max_retries)
+        if retries > max_retries:
+            if self.stats:
+                self.stats.inc_value('retry/max_reached')
+            logger.warn('@retry, gave up %s after %d retries: %s'
+                        % (request, retries - 1, exc), spider=spider)
+            return None
+
+        delay = self.backoff(retries)
+        meta = dict(request.meta, retry_times=retries, not_before=time.time() + delay,
+                    dont_filter=True)
+        meta.pop('redirect_urls', None)
+        if self.stats:
+            self.stats.inc_value('retry/count')
+            self.stats.inc_value('retry/reason/%s' % reason)
+        logger.info('@retry, retry %s in %.1fs (%d/%d): %s'
+                    % (request, delay, retries, max_retries, exc), spider=spider)
+        return request.replace(meta=meta)
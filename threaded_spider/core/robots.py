@@ -0,0 +1,262 @@
+"""
+Obey the robots.txt of the hosts.
+
+The robots.txt of a host is fetched once by a background thread when its
+first request is enqueued, the requests to the host enqueued meanwhile are
+parked until the fetch finishes. The rules are compiled into a matcher
+checked on enqueuing and cached for ROBOTSTXT_CACHE_TTL seconds, and the
+Crawl-delay is honoured by the scheduler.
+"""
+from __future__ import with_statement
+
+import re
+import time
+import Queue
+import urlparse
+import threading
+from collections import OrderedDict
+
+from threaded_spider import logger
+from threaded_spider.http import Request
+from threaded_spider.http.common import request_host
+
+# Only the first 500KB of a robots.txt are parsed, see RFC 9309.
+MAX_ROBOTS_SIZE = 500 * 1024
+# Seconds to cache the allow-all rules after a failed fetch.
+ERROR_TTL = 300
+
+class RobotRules(object):
+    """The compiled rules of a robots.txt for a user agent."""
+
+    def __init__(self, rules=(), crawl_delay=None):
+        # (pattern length, allow, prefix or compiled regex), the longest
+        # pattern first and allow first for the same length, so the first
+        # match decides.
+        self.rules = sorted(rules, key=lambda x: (-x[0], not x[1]))
+        self.crawl_delay = crawl_delay
+
+    @classmethod
+    def parse(cls, content, agent):
+        """Parse the robots.txt content for the user agent product token."""
+        agent = agent.lower()
+        groups = []
+        group = None
+        for line in content[:MAX_ROBOTS_SIZE].splitlines():
+            line = line.split('#', 1)[0].strip()
+            field, sep, value = line.partition(':')
+            if not sep:
+                continue
+            field, value = field.strip().lower(), value.strip()
+            if field == 'user-agent':
+                if group is None or group[1] or group[2] is not None:
+                    group = [[], [], None]
+                    groups.append(group)
+                group[0].append(value.lower())
+            elif group is None:
+                continue
+            elif field in ('allow', 'disallow') and value:
+                group[1].append((field == 'allow', value))
+            elif field == 'crawl-delay':
+                try:
+                    group[2] = float(value)
+                except ValueError:
+                    pass
+
+        matched = [g for g in groups
+                   if any(a != '*' and a and a in agent for a in g[0])]
+        if not matched:
+            matched = [g for g in groups if '*' in g[0]]
+
+        rules = []
+        crawl_delay = None
+        for agents, group_rules, delay in matched:
+            for allow, pattern in group_rules:
+                rules.append((len(pattern), allow, cls._compile(pattern)))
+            if delay is not None:
+                crawl_delay = max(crawl_delay, delay)
+        return cls(rules, crawl_delay)
+
+    @staticmethod
+    def _compile(pattern):
+        if '*' not in pattern and not pattern.endswith('$'):
+            return pattern
+        anchored = pattern.endswith('$')
+        if anchored:
+            pattern = pattern[:-1]
+        regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+        return re.compile(regex + ('\\Z' if anchored else ''))
+
+    def allowed(self, path):
+        if path == '/robots.txt':
+            return True
+        for length, allow, matcher in self.rules:
+            if isinstance(matcher, str):
+                if path.startswith(matcher):
+                    return allow
+            elif matcher.match(path):
+                return allow
+        return True
+
+ALLOW_ALL = RobotRules()
+
+class RobotsTxt(object):
+    """
+    The robots.txt rules of the hosts, used by the scheduler only from the
+    main thread, the fetches run in `fetch_threads` background threads.
+    """
+
+    def __init__(self, crawler, agent, ttl=86400, maxsize=10000, fetch_threads=2,
+                 enabled=True):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.agent = agent
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.fetch_threads = fetch_threads
+        self.enabled = enabled
+        # host -> (expire time, RobotRules)
+        self.cache = OrderedDict()
+        # host -> requests waiting for the robots.txt being fetched
+        self.parked = {}
+        # Hosts whose robots.txt is fetched, appended by the fetch threads.
+        self.fetched = []
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        agent = settings.get('ROBOTSTXT_USER_AGENT') or \
+            (settings.get('USER_AGENT') or '*').split('/')[0]
+        return cls(crawler, agent,
+                   ttl=settings.getfloat('ROBOTSTXT_CACHE_TTL', 86400),
+                   maxsize=settings.getint('ROBOTSTXT_CACHE_SIZE', 10000),
+                   fetch_threads=settings.getint('ROBOTSTXT_FETCH_THREADS', 2),
+                   enabled=settings.getbool('ROBOTSTXT_OBEY'))
+
+    def __len__(self):
+        return sum(len(requests) for requests in self.parked.values())
+
+    def parked_requests(self):
+        requests = []
+        for parked in self.parked.values():
+            requests.extend(parked)
+        return requests
+
+    def _rules(self, host):
+        with self._lock:
+            entry = self.cache.get(host)
+            if entry is None:
+                return None
+            expire, rules = entry
+            if expire < time.time():
+                del self.cache[host]
+                return None
+            return rules
+
+    def allowed(self, request):
+        """Return whether the request is allowed, or None if the robots.txt
+        of its host is being fetched, and the request is parked until then."""
+        if not self.enabled or request.meta.get('dont_obey_robotstxt'):
+            return True
+
+        host = request_host(request)
+        rules = self._rules(host)
+        if rules is None:
+            parked = self.parked.get(host)
+            if parked is None:
+                # The first request to the host, fetch its robots.txt.
+                parked = self.parked[host] = []
+                self._fetch(host, request)
+            parked.append(request)
+            return None
+
+        parts = urlparse.urlsplit(request.url)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        if rules.allowed(path):
+            return True
+        self.stats.inc_value('robotstxt/forbidden')
+        logger.debug('@robotstxt, forbidden by robots.txt: %s' % request)
+        return False
+
+    def crawl_delay(self, host):
+        if not self.enabled:
+            return 0
+        rules = self._rules(host)
+        if rules is None or rules.crawl_delay is None:
+            return 0
+        return rules.crawl_delay
+
+    def ready_requests(self):
+        """Return the parked requests whose robots.txt is fetched."""
+        requests = []
+        while self.fetched:
+            host = self.fetched.pop()
+            requests.extend(self.parked.pop(host, ()))
+        return requests
+
+    def _fetch(self, host, request):
+        scheme = urlparse.urlsplit(request.url).scheme
+        self._queue.put((host, '%s://%s/robots.txt' % (scheme, host)))
+        if not self._threads:
+            for i in xrange(max(1, self.fetch_threads)):
+                t = threading.Thread(target=self._fetch_worker, name='robotstxt_%d' % i)
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
+
+    def _fetch_worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            host, url = item
+            try:
+                rules, ttl = self._download(url)
+            except Exception:
+                logger.error(why='@robotstxt, fail to parse %s' % url)
+                rules, ttl = ALLOW_ALL, ERROR_TTL
+            self._store(host, rules, ttl)
+            self.fetched.append(host)
+
+    def _download(self, url):
+        """Return the rules and the seconds to cache them."""
+        downloader = self.crawler.engine.downloader
+        request = Request(url, meta={'dont_retry': True, 'dont_filter': True,
+                                     'allowed_content_types': None})
+        try:
+            response = downloader._download(request)
+        except Exception, e:
+            status = getattr(e, 'status', None)
+            if status is not None and 400 <= status < 500:
+                # No robots.txt, everything is allowed.
+                self.stats.inc_value('robotstxt/response_status_count/%d' % status)
+                return ALLOW_ALL, self.ttl
+            self.stats.inc_value('robotstxt/fetch_errors')
+            logger.warn('@robotstxt, fail to fetch %s, allow all for %ds: %s'
+                        % (url, ERROR_TTL, e))
+            return ALLOW_ALL, ERROR_TTL
+
+        self.stats.inc_value('robotstxt/response_status_count/%d' % response.status)
+        content = response.body
+        if not isinstance(content, str):
+            # A large body is a bytearray or an mmap.
+            content = str(buffer(content))
+        if content.startswith('\xef\xbb\xbf'):
+            content = content[3:]
+        return RobotRules.parse(content, self.agent), self.ttl
+
+    def _store(self, host, rules, ttl):
+        with self._lock:
+            self.cache.pop(host, None)
+            self.cache[host] = (time.time() + ttl, rules)
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def close(self):
+        for t in self._threads:
+            self._queue.put(None)
+        self._threads = []
@@ -1,39 +1,289 @@
-"""
-A scheduler is used to store the Request objects which 
-will be taken out to be processed by the downloader 
-and spider.
-"""
-
-import Queue
-
-from threaded_spider import logger
-
-class Scheduler(object):
-    
-    def __init__(self):
-        self.mq = Queue.Queue()
-       
-    def attach_spider(self, spider):
-        self.spider = spider
-        logger.info('@scheduler, Spider attached to scheduler.', spider=spider)
-        
-    def __len__(self):
-        return self.mq.qsize()
-    
-    def enqueue_request(self, request):
-        self.mq.put(request)
-        
-    def next_request(self):
-        try:
-            request = self.mq.get_nowait()
-        except Queue.Empty, e:
-            logger.debug('@scheduler, The scheduler queue is empty.', spider=self.spider)
-        except Exception, e:
-            logger.error(why='@scheduler, Fail to retrive data from the scheduler queue.', 
-                         spider=self.spider)
-        else:
-            return request
-        return None
-    
-    def has_pending_requests(self):
-        return len(self)
\ No newline at end of file
+"""
+A scheduler is used to store the Request objects which
+will be taken out to be processed by the downloader
+and spider.
+"""
+
+import time
+import heapq
+import Queue
+import urlparse
+import posixpath
+import itertools
+from collections import deque
+
+from threaded_spider import logger
+from threaded_spider.http.common import request_host
+from threaded_spider.core.ratelimit import RateLimiter
+from threaded_spider.core.robots import RobotsTxt
+
+# Seconds between two scans for the idle slots to drop.
+SLOT_GC_INTERVAL = 10
+
+class Slot(object):
+    """
+    The requests to a domain or an IP address, which is the unit of the
+    download delay and concurrency limit.
+
+    `host` is the host of the first request, whose per host settings apply
+    to the slot.
+    """
+
+    def __init__(self, key, host, is_ip=False):
+        self.key = key
+        self.host = host
+        self.is_ip = is_ip
+        # Requests held back because the slot is full or visited too recently.
+        self.queue = deque()
+        self.active = 0
+        self.last_visit = 0
+
+class Scheduler(object):
+    """
+    Dispatch the requests within the politeness limits of their slots.
+
+    With SCHEDULER_CONNECTION_AFFINITY, the held back requests of the hosts
+    having idle connections in the downloader are dispatched first, so
+    that the requests to a host follow each other on a warm connection.
+    """
+
+    def __init__(self, crawler, downloader=None):
+        self.settings = crawler.settings
+        self.downloader = downloader
+        self.affinity = downloader is not None and \
+            self.settings.getbool('SCHEDULER_CONNECTION_AFFINITY', True)
+        self.stats = crawler.stats
+        self.dnscache = crawler.dnscache
+        self.autothrottle = crawler.autothrottle
+        self.dupefilter = crawler.dupefilter
+        self.breaker = crawler.breaker
+        self.robots = RobotsTxt.from_crawler(crawler)
+        self.mq = Queue.Queue()
+        # Politeness delays and concurrency limits, they could be changed
+        # while crawling.
+        self.delay = self.settings.getfloat('DOWNLOAD_DELAY', 0)
+        self.host_delays = dict(self.settings.get('DOWNLOAD_DELAY_PER_HOST', {}))
+        self.per_domain = self.settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN', 0)
+        self.per_ip = self.settings.getint('CONCURRENT_REQUESTS_PER_IP', 0)
+        self.request_limiter = RateLimiter(
+            self.settings.getfloat('RATELIMIT_REQUESTS_PER_SEC', 0),
+            self.settings.getfloat('RATELIMIT_REQUESTS_PER_SEC_PER_HOST', 0),
+            name='requests', stats=self.stats, burst=1)
+        self.slots = {}
+        # Keys of the slots holding back requests.
+        self.blocked = set()
+        # Heap of (not_before, seq, request) for the requests with
+        # `not_before` in meta, such as retries waiting for backoff.
+        self.waiting = []
+        self._seq = itertools.count()
+        # Slot keys of the finished downloads appended by other threads.
+        self.finished = []
+        self._next_gc = 0
+        self.ignored_extensions = frozenset()
+
+    def attach_spider(self, spider):
+        self.spider = spider
+        extensions = getattr(spider, 'ignored_extensions', None) or \
+            self.settings.get('IGNORED_EXTENSIONS', [])
+        self.ignored_extensions = frozenset(ext.lower().lstrip('.') for ext in extensions)
+        logger.info('@scheduler, Spider attached to scheduler.', spider=spider)
+
+    def __len__(self):
+        return (self.mq.qsize() + len(self.waiting) + len(self.robots) +
+                sum(len(self.slots[key].queue) for key in self.blocked))
+
+    def enqueue_request(self, request):
+        if self._ignored_extension(request):
+            return
+        if self.dupefilter.request_seen(request):
+            return
+        self._enqueue(request)
+
+    def _enqueue(self, request):
+        if not self.robots.allowed(request):
+            # Dropped, or parked until the robots.txt is fetched.
+            return
+        not_before = request.meta.get('not_before')
+        if not_before and not_before > time.time():
+            heapq.heappush(self.waiting, (not_before, next(self._seq), request))
+            return
+        self.mq.put(request)
+        # Resolve a new host before its first request is dispatched.
+        self.dnscache.prefetch(urlparse.urlsplit(request.url).hostname)
+
+    def _ignored_extension(self, request):
+        """Whether the URL path ends with an extension in IGNORED_EXTENSIONS,
+        such as the images, videos and archives."""
+        if not self.ignored_extensions:
+            return False
+        path = urlparse.urlsplit(request.url).path
+        extension = posixpath.splitext(path)[1][1:].lower()
+        if extension not in self.ignored_extensions:
+            return False
+        self.stats.inc_value('scheduler/ignored_extension')
+        logger.debug('@scheduler, ignore %s by its extension.' % request, spider=self.spider)
+        return True
+
+    def request_done(self, request):
+        """Called by any thread when the download of a request finishes."""
+        self.finished.append(request.meta.get('scheduler_slot'))
+
+    def _release_finished(self):
+        while self.finished:
+            slot = self.slots.get(self.finished.pop())
+            if slot is not None and slot.active > 0:
+                slot.active -= 1
+
+    def _get_slot(self, request):
+        """Return the slot of a request, keyed by its IP address if
+        CONCURRENT_REQUESTS_PER_IP is set and the host is resolved, or
+        by meta download_slot if given, else by its host."""
+        host = request_host(request)
+        key, is_ip = request.meta.get('download_slot'), False
+        if key is None and self.per_ip:
+            key = self.dnscache.cached_address(urlparse.urlsplit(request.url).hostname)
+            is_ip = key is not None
+        if key is None:
+            key = host
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = Slot(key, host, is_ip)
+        return slot
+
+    def _dispatch(self, slot, request, now):
+        slot.last_visit = now
+        slot.active += 1
+        self.request_limiter.consume(slot.host)
+        # Not download_slot, which is the slot chosen by the user. A retry
+        # copying the meta gets its slot chosen again.
+        request.meta['scheduler_slot'] = slot.key
+        return request
+
+    def next_request(self):
+        now = time.time()
+        self._release_finished()
+        for request in self.robots.ready_requests():
+            self._enqueue(request)
+        while self.waiting and self.waiting[0][0] <= now:
+            self.mq.put(heapq.heappop(self.waiting)[2])
+        if now >= self._next_gc:
+            self._gc_slots(now)
+
+        for key in self._blocked_keys():
+            slot = self.slots[key]
+            if self.breaker.should_drop(slot.host):
+                self._drop_queue(slot)
+                continue
+            if self._slot_ready(slot, slot.queue[0], now):
+                request = slot.queue.popleft()
+                if not slot.queue:
+                    self.blocked.discard(key)
+                if self.affinity:
+                    self._count_dispatch(slot)
+                return self._dispatch(slot, request, now)
+
+        while True:
+            try:
+                request = self.mq.get_nowait()
+            except Queue.Empty, e:
+                logger.debug('@scheduler, The scheduler queue is empty.', spider=self.spider)
+            except Exception, e:
+                logger.error(why='@scheduler, Fail to retrive data from the scheduler queue.',
+                             spider=self.spider)
+            else:
+                slot = self._get_slot(request)
+                if not slot.queue and self._slot_ready(slot, request, now):
+                    if self.affinity:
+                        self._count_dispatch(slot)
+                    return self._dispatch(slot, request, now)
+                # Defer it without taking a thread.
+                slot.queue.append(request)
+                self.blocked.add(slot.key)
+                self.stats.max_value('scheduler/max_slot_queue', len(slot.queue))
+                continue
+            return None
+
+    def _blocked_keys(self):
+        """Return the keys of the slots holding back requests, the ones
+        whose host has an idle connection first."""
+        if not self.affinity or len(self.blocked) < 2:
+            return list(self.blocked)
+        warm, cold = [], []
+        for key in self.blocked:
+            if self.downloader.idle_connections(self.slots[key].host):
+                warm.append(key)
+            else:
+                cold.append(key)
+        return warm + cold
+
+    def _count_dispatch(self, slot):
+        if self.downloader.idle_connections(slot.host):
+            self.stats.inc_value('scheduler/warm_dispatches')
+        else:
+            self.stats.inc_value('scheduler/cold_dispatches')
+
+    def pending_requests(self):
+        requests = list(self.mq.queue)
+        requests.extend(request for _, _, request in sorted(self.waiting))
+        for key in self.blocked:
+            requests.extend(self.slots[key].queue)
+        requests.extend(self.robots.parked_requests())
+        return requests
+
+    def get_delay(self, host):
+        delay = self.host_delays.get(host, self.delay)
+        return max(delay, self.autothrottle.get_delay(host),
+                   self.robots.crawl_delay(host))
+
+    def get_concurrency(self, slot):
+        """Return the maximum requests downloaded from a slot at once, 0 for no limit."""
+        limit = self.per_ip if slot.is_ip else self.per_domain
+        throttled = self.autothrottle.get_concurrency(slot.host, limit)
+        if limit and throttled:
+            return min(limit, throttled)
+        return limit or throttled
+
+    def _slot_ready(self, slot, request, now):
+        """Whether `request`, the next one of the slot, could be dispatched now."""
+        concurrency = self.get_concurrency(slot)
+        if concurrency and slot.active >= concurrency:
+            return False
+        if self.request_limiter.wait_time(slot.host) > 0:
+            return False
+        delay = self.get_delay(slot.host)
+        if delay and now - slot.last_visit < delay:
+            return False
+        # Last, as it takes the request as the probe of a half open breaker.
+        return self.breaker.allow(slot.host, request, now)
+
+    def _drop_queue(self, slot):
+        """Drop the held back requests of a slot whose host is dead."""
+        dropped = len(slot.queue)
+        slot.queue.clear()
+        self.blocked.discard(slot.key)
+        self.stats.inc_value('breaker/dropped_requests', dropped)
+        logger.warn('@scheduler, %s seems dead, %d queued requests dropped.'
+                    % (slot.host, dropped), spider=self.spider)
+
+    def _gc_slots(self, now):
+        """Drop the idle slots and update the slot stats."""
+        self._next_gc = now + SLOT_GC_INTERVAL
+        for key, slot in self.slots.items():
+            if (not slot.queue and not slot.active and
+                    now - slot.last_visit > self.get_delay(slot.host)):
+                del self.slots[key]
+        self.stats.set_value('scheduler/slots', len(self.slots))
+        self.stats.set_value('scheduler/blocked_slots', len(self.blocked))
+
+    def slot_stats(self):
+        """Return the (key, queued, active) tuples of the slots,
+        the one with the longest queue first."""
+        stats = [(slot.key, len(slot.queue), slot.active) for slot in self.slots.values()]
+        stats.sort(key=lambda x: (x[1], x[2]), reverse=True)
+        return stats
+
+    def has_pending_requests(self):
+        return len(self)
+
+    def close(self):
+        self.robots.close()
@@ -0,0 +1,120 @@
+"""
+The stall watchdog finds the threadpool workers hanging in a task, such as
+a download or a parse call, and logs their stacks.
+
+A task running longer than STALLWATCH_THRESHOLD seconds is reported once,
+by the watchdog thread whatever the other threads are doing.
+
+The report of all threads is also available on demand by sending SIGUSR2
+to the process. CPython runs the signal handlers in the main thread only,
+between two bytecodes, so the report comes once the main thread runs
+Python code: not while it's blocked in a C call, such as waiting on a lock
+or a socket without timeout. Python 2 gives no way to wait for a signal in
+another thread, the stalled workers are reported by the threshold then.
+"""
+
+import sys
+import time
+import signal
+import threading
+import traceback
+
+from threaded_spider import logger
+
+class StallWatchdog(threading.Thread):
+
+    def __init__(self, crawler):
+        super(StallWatchdog, self).__init__()
+        self.setName('stallwatch_thread')
+        self.setDaemon(True)
+        self.crawler = crawler
+        self.thread_pool = crawler.engine.thread_pool
+        self.threshold = crawler.settings.getfloat('STALLWATCH_THRESHOLD', 0)
+        self.interval = crawler.settings.getfloat('STALLWATCH_INTERVAL', 10)
+        self.running = False
+        self._reported = set()
+        self._dump_requested = False
+        self._wakeup = threading.Event()
+
+    def install(self):
+        """Install the signal handler and start watching, must be called
+        by the main thread."""
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, self._on_signal)
+        self.running = True
+        self.start()
+
+    def _on_signal(self, signum, frame):
+        # Run by the main thread, only set a flag, the report is done by
+        # the watchdog thread.
+        self._dump_requested = True
+        self._wakeup.set()
+
+    def stop(self):
+        self.running = False
+        self._wakeup.set()
+        # Don't leave it waiting while the interpreter shuts down.
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def run(self):
+        while self.running:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if not self.running:
+                break
+
+            try:
+                if self._dump_requested:
+                    self._dump_requested = False
+                    self.dump()
+                if self.threshold:
+                    self.check()
+            except Exception:
+                logger.error(why='@stallwatch, fail to inspect the worker threads.')
+
+    def check(self):
+        """Log the stacks of the workers whose task runs past the threshold."""
+        now = time.time()
+        frames = sys._current_frames()
+        started = self.thread_pool.task_started.items()
+        for thread, (start_time, func, args) in started:
+            key = (thread.ident, start_time)
+            if now - start_time < self.threshold or key in self._reported:
+                continue
+
+            self._reported.add(key)
+            logger.warn('@stallwatch, %s stalled for %.1f seconds in %s%r\n%s'
+                        % (thread.getName(), now - start_time, _func_name(func), args,
+                           _format_frame(frames.get(thread.ident))))
+
+        # Forget the tasks finished.
+        alive = set((thread.ident, start_time) for thread, (start_time, _, _) in started)
+        self._reported &= alive
+
+    def dump(self):
+        """Log the task and stack of every thread in the process."""
+        now = time.time()
+        frames = sys._current_frames()
+        tasks = dict((thread.ident, info) for thread, info
+                     in self.thread_pool.task_started.items())
+        lines = ['@stallwatch, dump %d threads:' % len(frames)]
+        for thread in threading.enumerate():
+            info = tasks.get(thread.ident)
+            if info is None:
+                task = 'idle' if thread in self.thread_pool.waiters else '-'
+            else:
+                start_time, func, args = info
+                task = 'running %s%r for %.1f seconds' % (_func_name(func), args,
+                                                         now - start_time)
+            lines.append('--- %s: %s\n%s' % (thread.getName(), task,
+                                           _format_frame(frames.get(thread.ident))))
+        logger.warn('\n'.join(lines))
+
+def _func_name(func):
+    return getattr(func, '__name__', repr(func))
+
+def _format_frame(frame):
+    if frame is None:
+        return '    <no frame>'
+    return ''.join(traceback.format_stack(frame)).rstrip('\n')
@@ -0,0 +1,42 @@
+"""
+Collect the statistics of a crawl, such as counters of the downloader,
+they are dumped to the log when the crawler stops.
+"""
+
+from threaded_spider import logger
+from threaded_spider.basic.threadable import synchronize
+
+class StatsCollector(object):
+
+    # Methods called by multiple threads, see basic.threadable.
+    synchronized = ['get_value', 'set_value', 'inc_value', 'max_value',
+                    'min_value', 'get_stats']
+
+    def __init__(self):
+        self._stats = {}
+
+    def get_value(self, key, default=None):
+        return self._stats.get(key, default)
+
+    def set_value(self, key, value):
+        self._stats[key] = value
+
+    def inc_value(self, key, count=1, start=0):
+        self._stats[key] = self._stats.get(key, start) + count
+
+    def max_value(self, key, value):
+        self._stats[key] = max(self._stats.get(key, value), value)
+
+    def min_value(self, key, value):
+        self._stats[key] = min(self._stats.get(key, value), value)
+
+    def get_stats(self):
+        return self._stats.copy()
+
+    def dump(self):
+        stats = self.get_stats()
+        logger.info('@stats, dump %d stats:' % len(stats))
+        for key in sorted(stats):
+            logger.info('    %s: %r' % (key, stats[key]))
+
+synchronize(StatsCollector)
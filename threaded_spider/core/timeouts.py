@@ -0,0 +1,72 @@
+"""
+Decide the connect and read timeouts of a download, from the request meta,
+the per host settings or the latency observed for the host.
+"""
+from collections import deque
+
+# Latencies kept for each host.
+LATENCY_WINDOW = 100
+# Don't adapt the timeout until so many latencies are observed.
+MIN_SAMPLES = 10
+
+class DownloadTimeouts(object):
+    """
+    The read timeout of a host without explicit setting adapts to the p99 of
+    its latencies multiplied by `adaptive_factor` when `adaptive` is on,
+    bounded by `min_timeout` and the default read timeout, so that a host
+    going dead doesn't tie up a thread for the full timeout.
+    """
+
+    def __init__(self, connect_timeout=10, read_timeout=60, host_connect_timeouts=None,
+                 host_read_timeouts=None, adaptive=False, adaptive_factor=3,
+                 min_timeout=5):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.host_connect_timeouts = dict(host_connect_timeouts or {})
+        self.host_read_timeouts = dict(host_read_timeouts or {})
+        self.adaptive = adaptive
+        self.adaptive_factor = adaptive_factor
+        self.min_timeout = min_timeout
+        # host -> deque of the latest latencies
+        self.latencies = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(connect_timeout=settings.getfloat('DOWNLOAD_CONNECT_TIMEOUT', 10),
+                   read_timeout=settings.getfloat('DOWNLOAD_TIMEOUT', 60),
+                   host_connect_timeouts=settings.get('DOWNLOAD_CONNECT_TIMEOUT_PER_HOST', {}),
+                   host_read_timeouts=settings.get('DOWNLOAD_TIMEOUT_PER_HOST', {}),
+                   adaptive=settings.getbool('DOWNLOAD_TIMEOUT_ADAPTIVE'),
+                   adaptive_factor=settings.getfloat('DOWNLOAD_TIMEOUT_ADAPTIVE_FACTOR', 3),
+                   min_timeout=settings.getfloat('DOWNLOAD_TIMEOUT_MIN', 5))
+
+    def get(self, request, host):
+        """Return the (connect timeout, read timeout) of the request to host."""
+        meta = request.meta
+        connect = meta.get('connect_timeout') or \
+            self.host_connect_timeouts.get(host, self.connect_timeout)
+
+        read = meta.get('download_timeout') or self.host_read_timeouts.get(host)
+        if read is None:
+            read = self.read_timeout
+            if self.adaptive:
+                read = self._adaptive_timeout(host, read)
+        return connect, read
+
+    def _adaptive_timeout(self, host, default):
+        samples = self.latencies.get(host)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return default
+        samples = sorted(samples)
+        p99 = samples[int(0.99 * (len(samples) - 1))]
+        return max(self.min_timeout, min(default, p99 * self.adaptive_factor))
+
+    def record(self, host, latency):
+        """Record the seconds taken by a successful download from host."""
+        if not self.adaptive:
+            return
+        samples = self.latencies.get(host)
+        if samples is None:
+            samples = self.latencies.setdefault(host, deque(maxlen=LATENCY_WINDOW))
+        samples.append(latency)
@@ -0,0 +1,321 @@
+"""
+Capture the downloaded responses into WARC files, and replay them later
+without the network.
+
+WarcWriter appends a request record and a response record for every
+response passed to the spider, each record compressed as a gzip member of
+its own, so that a record could be read at its offset without the ones
+before it. The files rotate when they exceed WARC_MAX_SIZE, and an index
+of the response records is written next to each file as <file>.idx, with
+lines of `fingerprint offset length url`.
+
+WarcReplayDownloader serves the responses of the captured requests from
+the WARC files through these indexes, rebuilt by scanning the file if the
+index is missing, so that a crawl could be run again at disk speed.
+"""
+from __future__ import with_statement
+
+import os
+import glob
+import mmap
+import time
+import uuid
+import zlib
+import base64
+import hashlib
+import httplib
+import urlparse
+import threading
+
+from threaded_spider import logger
+from threaded_spider.http import Response, Headers
+from threaded_spider.http.common import fingerprint, request_fingerprint
+from threaded_spider.core.downloader import Downloader
+
+WARC_VERSION = 'WARC/1.1'
+# Headers describing the raw message which doesn't apply to the decoded
+# body captured.
+STRIPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+# Bytes read at a time when scanning a WARC file for its index.
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+def _warc_date(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+def _block_digest(parts):
+    sha1 = hashlib.sha1()
+    for part in parts:
+        sha1.update(part)
+    return 'sha1:' + base64.b32encode(sha1.digest())
+
+def build_record(warc_type, uri, parts, content_type, extra_headers=()):
+    """Return the record id and the compressed record whose block is
+    the concatenation of `parts`, str or buffers such as an mmap or
+    bytearray body."""
+    record_id = '<urn:uuid:%s>' % uuid.uuid4()
+    headers = [('WARC-Type', warc_type), ('WARC-Record-ID', record_id),
+               ('WARC-Date', _warc_date())]
+    if uri:
+        headers.append(('WARC-Target-URI', uri))
+    headers.extend(extra_headers)
+    headers.extend([('WARC-Block-Digest', _block_digest(parts)),
+                    ('Content-Type', content_type),
+                    ('Content-Length', str(sum(len(part) for part in parts)))])
+    head = '%s\r\n%s\r\n\r\n' % (WARC_VERSION,
+                                 '\r\n'.join('%s: %s' % item for item in headers))
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    data = [compressor.compress(head)]
+    for part in parts:
+        if isinstance(part, bytearray):
+            # zlib takes read-only buffers only.
+            part = buffer(part)
+        data.append(compressor.compress(part))
+    data.append(compressor.compress('\r\n\r\n'))
+    data.append(compressor.flush())
+    return record_id, ''.join(data)
+
+def parse_record(data):
+    """Return the (headers, block) of an uncompressed record, the headers
+    keys are lowercased."""
+    head, _, rest = data.partition('\r\n\r\n')
+    lines = head.split('\r\n')
+    if not lines[0].startswith('WARC/'):
+        raise ValueError('Not a WARC record: %r' % lines[0][:50])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    return headers, rest[:length]
+
+def parse_http_response(block):
+    """Return the (status, headers, body) of an HTTP response block."""
+    head, _, body = block.partition('\r\n\r\n')
+    status_line, _, raw_headers = head.partition('\r\n')
+    status = int(status_line.split(' ', 2)[1])
+    return status, Headers.from_raw(raw_headers), body
+
+def iter_members(f):
+    """Yield the (offset, length, data) of the gzip members of a file."""
+    offset = 0
+    buf = ''
+    while True:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out = []
+        consumed = 0
+        while True:
+            if not buf:
+                buf = f.read(SCAN_CHUNK_SIZE)
+                if not buf:
+                    break
+            out.append(decompressor.decompress(buf))
+            consumed += len(buf)
+            buf = decompressor.unused_data
+            if buf:
+                consumed -= len(buf)
+                break
+        if not consumed:
+            return
+        out.append(decompressor.flush())
+        yield offset, consumed, ''.join(out)
+        offset += consumed
+
+class WarcWriter(object):
+    """
+    Append the request and response records to rotating WARC files
+    `<prefix>-<timestamp>-<serial>.warc.gz` in `directory`, called by the
+    engine for every downloaded response from any thread.
+    """
+
+    def __init__(self, directory, prefix='crawl', max_size=1024 * 1024 * 1024,
+                 stats=None, dnscache=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_size = max_size
+        self.stats = stats
+        self.dnscache = dnscache
+        self.path = None
+        self.file = None
+        self.index = None
+        self.size = 0
+        self.serial = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(settings.get('WARC_DIR', 'warc'),
+                   prefix=settings.get('WARC_PREFIX', 'crawl'),
+                   max_size=settings.getint('WARC_MAX_SIZE', 1024 * 1024 * 1024),
+                   stats=crawler.stats, dnscache=crawler.dnscache)
+
+    def _open(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.serial += 1
+        name = '%s-%s-%05d.warc.gz' % (self.prefix, time.strftime('%Y%m%d%H%M%S'),
+                                       self.serial)
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path, 'ab')
+        self.index = open(self.path + '.idx', 'ab')
+        self.size = self.file.tell()
+        info = 'software: threaded_spider\r\nformat: WARC File Format 1.1\r\n'
+        self._append(build_record('warcinfo', None, [info], 'application/warc-fields',
+                                  [('WARC-Filename', name)])[1])
+        logger.info('@warc, writing %s' % self.path)
+
+    def _append(self, data):
+        offset = self.size
+        self.file.write(data)
+        self.size += len(data)
+        return offset
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.index.close()
+            self.file = self.index = None
+
+    def write(self, response):
+        request = response.request
+        parts = urlparse.urlsplit(request.url)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        request_head = ['%s %s HTTP/1.1' % (request.method, path), 'Host: %s' % parts.netloc]
+        request_head.extend('%s: %s' % item for item in request.headers.items())
+        request_parts = ['\r\n'.join(request_head) + '\r\n\r\n', request.body or '']
+
+        body = response.body
+        response_head = ['HTTP/1.1 %d %s' % (response.status,
+                                             httplib.responses.get(response.status, ''))]
+        # Every value of a repeated header such as Set-Cookie on a line.
+        response_head.extend('%s: %s' % (name, value)
+                             for name, value in response.headers.multi_items()
+                             if name not in STRIPPED_HEADERS)
+        response_head.append('Content-Length: %d' % len(body))
+        response_parts = ['\r\n'.join(response_head) + '\r\n\r\n', body]
+
+        extra_headers = []
+        address = self.dnscache and self.dnscache.cached_address(parts.hostname)
+        if address:
+            extra_headers.append(('WARC-IP-Address', address))
+        # Compress out of the lock.
+        response_id, response_record = build_record(
+            'response', response.url, response_parts, 'application/http; msgtype=response',
+            extra_headers)
+        request_record = build_record(
+            'request', request.url, request_parts, 'application/http; msgtype=request',
+            [('WARC-Concurrent-To', response_id)])[1]
+
+        with self._lock:
+            if self.file is None or self.size >= self.max_size:
+                self._close_file()
+                self._open()
+            self._append(request_record)
+            offset = self._append(response_record)
+            self.index.write('%s %d %d %s\n' % (request_fingerprint(request), offset,
+                                                len(response_record), response.url))
+        if self.stats:
+            self.stats.inc_value('warc/records', 2)
+            self.stats.inc_value('warc/bytes', len(request_record) + len(response_record))
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+class WarcArchive(object):
+    """The response records of WARC files, looked up by request fingerprint."""
+
+    def __init__(self, paths):
+        # fingerprint -> (mmap of the file, offset, length)
+        self.index = {}
+        self.maps = []
+        for path in paths:
+            self._load(path)
+
+    def _load(self, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(data)
+        if os.path.exists(path + '.idx'):
+            with open(path + '.idx') as f:
+                for line in f:
+                    fp, offset, length, url = line.split(' ', 3)
+                    self.index[fp] = (data, int(offset), int(length))
+            return
+
+        logger.info('@warc, no index of %s, scanning it' % path)
+        requests = {}
+        with open(path, 'rb') as f:
+            for offset, length, record in iter_members(f):
+                headers, block = parse_record(record)
+                warc_type = headers.get('warc-type')
+                if warc_type == 'request':
+                    head, _, body = block.partition('\r\n\r\n')
+                    method = head.split(' ', 1)[0]
+                    fp = fingerprint(method, headers['warc-target-uri'], body)
+                    requests[headers.get('warc-concurrent-to')] = fp
+                elif warc_type == 'response':
+                    fp = requests.pop(headers.get('warc-record-id'), None)
+                    if fp is not None:
+                        self.index[fp] = (data, offset, length)
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, request):
+        """Return the (url, status, headers, body) captured for the request,
+        or None."""
+        entry = self.index.get(request_fingerprint(request))
+        if entry is None:
+            return None
+        data, offset, length = entry
+        record = zlib.decompress(data[offset:offset + length], 16 + zlib.MAX_WBITS)
+        headers, block = parse_record(record)
+        status, http_headers, body = parse_http_response(block)
+        return headers['warc-target-uri'], status, http_headers, body
+
+    def close(self):
+        for data in self.maps:
+            data.close()
+        self.maps = []
+        self.index = {}
+
+class WarcReplayDownloader(Downloader):
+    """
+    Download the requests from the WARC files matched by the glob patterns
+    in WARC_REPLAY_FILES instead of the network. A request not captured
+    gets no response.
+    """
+
+    def __init__(self, crawler):
+        super(WarcReplayDownloader, self).__init__(crawler)
+        patterns = self.settings.get('WARC_REPLAY_FILES') or \
+            [os.path.join(self.settings.get('WARC_DIR', 'warc'), '*.warc.gz')]
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        paths = sorted(set(path for pattern in patterns for path in glob.glob(pattern)))
+        self.archive = WarcArchive(paths)
+        logger.info('@warc, replaying %d responses from %d files'
+                    % (len(self.archive), len(paths)))
+
+    def _download(self, request):
+        if self._exceeds_max_depth(request):
+            return None
+        captured = self.archive.get(request)
+        if captured is None:
+            self.stats.inc_value('warc/replay_missing')
+            logger.debug('@warc, %s not captured' % request)
+            return None
+        url, status, headers, body = captured
+        self.stats.inc_value('warc/replayed')
+        return Response._from_trusted(url, status=status, headers=headers, body=body,
+                                      request=request)
+
+    def close(self):
+        super(WarcReplayDownloader, self).close()
+        self.archive.close()
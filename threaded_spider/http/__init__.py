@@ -1,2 +1,3 @@
-from .request import Request
-from .response import Response
\ No newline at end of file
+from .request import Request
+from .response import Response
+from .headers import Headers
\ No newline at end of file
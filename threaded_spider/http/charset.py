@@ -0,0 +1,90 @@
+"""
+Detect the character encoding of a response body once, instead of trying
+to decode the whole body with one encoding after another.
+
+The encoding is taken from, in order, a byte order mark, the charset of
+the Content-Type header, the `<meta charset>` or `<meta http-equiv>` tag
+in the head of the document, and at last sniffed from the first
+SNIFF_SIZE bytes: utf-8 if they decode as such, else gb18030.
+"""
+import re
+import codecs
+
+# Bytes of the body searched for a <meta> tag and sniffed.
+SNIFF_SIZE = 4096
+# The ones falling back when no encoding is declared or the body isn't utf-8.
+DEFAULT_ENCODING = 'utf-8'
+FALLBACK_ENCODING = 'gb18030'
+
+# Longest first, the utf-32-le BOM starts with the utf-16-le one.
+BOMS = [
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+]
+# The declared encodings replaced by their supersets as the browsers do,
+# the pages labeled gb2312 often use characters of gbk only.
+SUPERSETS = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'ascii': 'cp1252',
+    'latin_1': 'cp1252',
+    'iso8859_1': 'cp1252',
+}
+
+_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?\s*([-\w.:]+)', re.I)
+_META_RE = re.compile(r'<meta\s[^>]*?charset\s*=\s*["\']?\s*([-\w.:]+)', re.I)
+
+def resolve_encoding(name):
+    """Return the python codec name of an encoding label, or None if it
+    isn't known."""
+    try:
+        name = codecs.lookup(name.strip().lower()).name
+    except (LookupError, UnicodeError):
+        return None
+    return SUPERSETS.get(name.replace('-', '_'), name)
+
+def bom_encoding(head):
+    """Return the (encoding, BOM length) of a body starting with a byte
+    order mark, or (None, 0)."""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return None, 0
+
+def header_encoding(content_type):
+    """Return the encoding of the charset parameter of a Content-Type."""
+    match = content_type and _CHARSET_RE.search(content_type)
+    return match and resolve_encoding(match.group(1))
+
+def meta_encoding(head):
+    """Return the encoding declared by a <meta> tag in the head of an html."""
+    match = _META_RE.search(head)
+    encoding = match and resolve_encoding(match.group(1))
+    if encoding and encoding.startswith(('utf-16', 'utf-32')):
+        # Wrong, the tag could not be read with it.
+        return DEFAULT_ENCODING
+    return encoding
+
+def sniff_encoding(head):
+    """Guess the encoding of an undeclared body from its head."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        # Not final, the sample may end in the middle of a character.
+        decoder.decode(head, False)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return DEFAULT_ENCODING
+
+def detect_encoding(content_type, body):
+    """Return the (encoding, BOM length) of a response body, a str, bytearray
+    or mmap, of which at most SNIFF_SIZE bytes are read."""
+    head = str(body[:SNIFF_SIZE])
+    encoding, bom_length = bom_encoding(head)
+    if encoding:
+        return encoding, bom_length
+    encoding = header_encoding(content_type) or meta_encoding(head) or \
+        sniff_encoding(head)
+    return encoding, 0
@@ -1,7 +1,26 @@
-def obsolete_setter(setter, attrname):
-    def new_setter(self, value):
-        c = self.__class__.__name__
-        msg = ('%s.%s is not modifiable, use %s.replace() instead.' 
-               % (c, attrname, c))
-        raise AttributeError(msg)
-    return new_setter
\ No newline at end of file
+import hashlib
+import urlparse
+
+from .url import canonicalize_url
+
+def obsolete_setter(setter, attrname):
+    def new_setter(self, value):
+        c = self.__class__.__name__
+        msg = ('%s.%s is not modifiable, use %s.replace() instead.' 
+               % (c, attrname, c))
+        raise AttributeError(msg)
+    return new_setter
+
+def request_host(request):
+    """Return the lowercased network location(host[:port]) of the url
+    of a request or response, which identifies a host for politeness."""
+    return urlparse.urlsplit(request.url).netloc.lower()
+
+def fingerprint(method, url, body=None):
+    """Return a hex digest identifying a request by its method, canonical
+    url and body."""
+    return hashlib.sha1('%s\n%s\n%s' % (method, canonicalize_url(url), body or '')).hexdigest()
+
+def request_fingerprint(request):
+    """Return the fingerprint of a request, computed once when created."""
+    return request.fingerprint
@@ -0,0 +1,207 @@
+"""
+The headers of a response, looked up case-insensitively.
+
+The downloaders hand over the raw header block as received, and most of
+the responses only get a few headers looked up by the downloader itself,
+such as Content-Length. The lookups go to a dict of the joined values,
+the one httplib has parsed already or one split out of the block on the
+first lookup, and the block is parsed into a dict of lists only when the
+headers are changed. The repeated headers such as Set-Cookie keep all
+their values, read by `getlist`, while `get` and `[]` return them joined
+by ', ' as httplib does.
+"""
+
+_missing = object()
+
+def _split_lines(raw):
+    """Return the (lowercased name, value) pairs of the lines of a block."""
+    pairs = []
+    for line in raw.split('\n'):
+        name, colon, value = line.partition(':')
+        if line[:1] in (' ', '\t'):
+            # A folded line continues the value of the previous one.
+            if pairs:
+                pairs[-1] = (pairs[-1][0], '%s %s' % (pairs[-1][1], line.strip()))
+        elif colon:
+            pairs.append((name.strip().lower(), value.strip()))
+    return pairs
+
+class Headers(object):
+
+    # `_raw` is the header block not parsed yet, `_values` the dict of
+    # lowercased name -> [values] once parsed, and `_joined` the dict of
+    # lowercased name -> joined values the lookups go to, built from
+    # either of them when first needed.
+    __slots__ = ('_raw', '_values', '_joined')
+
+    def __init__(self, headers=None):
+        """Create headers from a dict, a list of (name, value) pairs or
+        other headers. A value could be a list of the values of a repeated
+        header."""
+        self._raw = self._joined = None
+        self._values = {}
+        if headers is None:
+            return
+        if isinstance(headers, Headers):
+            headers = headers.multi_items()
+        elif hasattr(headers, 'iteritems'):
+            headers = headers.iteritems()
+        for name, value in headers:
+            if isinstance(value, (list, tuple)):
+                for v in value:
+                    self.add(name, v)
+            else:
+                self.add(name, value)
+
+    @classmethod
+    def from_raw(cls, raw, joined=None):
+        """Create headers from a block of `Name: value` lines separated by
+        CRLF or LF, without the status line, parsed when needed. `joined`
+        is the dict of the lowercased names and joined values if parsed
+        already, such as the one of an httplib message, which isn't changed."""
+        self = object.__new__(cls)
+        self._raw = raw
+        self._values = None
+        self._joined = joined
+        return self
+
+    def _join(self):
+        joined = {}
+        raw = self._raw
+        if raw is not None and '\n ' not in raw and '\n\t' not in raw:
+            # Without folded lines, the common case, in one pass.
+            for line in raw.split('\n'):
+                name, colon, value = line.partition(':')
+                if not colon:
+                    continue
+                name, value = name.strip().lower(), value.strip()
+                if name in joined:
+                    joined[name] = '%s, %s' % (joined[name], value)
+                else:
+                    joined[name] = value
+        elif raw is not None:
+            for name, value in _split_lines(raw):
+                if name in joined:
+                    joined[name] = '%s, %s' % (joined[name], value)
+                else:
+                    joined[name] = value
+        else:
+            for name, values in self._values.iteritems():
+                joined[name] = values[0] if len(values) == 1 else ', '.join(values)
+        self._joined = joined
+        return joined
+
+    def _parse(self):
+        """Return the dict of the values, to be changed."""
+        if self._values is None:
+            values = {}
+            for name, value in _split_lines(self._raw):
+                values.setdefault(name, []).append(value)
+            self._values = values
+            self._raw = None
+        self._joined = None
+        return self._values
+
+    def get(self, name, default=None):
+        joined = self._joined
+        if joined is None:
+            joined = self._join()
+        return joined.get(name.lower(), default)
+
+    def getlist(self, name):
+        """Return all the values of a header, an empty list if missing."""
+        name = name.lower()
+        if self._values is None:
+            return [value for n, value in _split_lines(self._raw) if n == name]
+        return list(self._values.get(name, ()))
+
+    def __getitem__(self, name):
+        value = self.get(name, _missing)
+        if value is _missing:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name, _missing) is not _missing
+
+    has_key = __contains__
+
+    def __setitem__(self, name, value):
+        self._parse()[name.lower()] = [value]
+
+    def add(self, name, value):
+        """Append a value to a header, which may be repeated."""
+        self._parse().setdefault(name.lower(), []).append(value)
+
+    def __delitem__(self, name):
+        del self._parse()[name.lower()]
+
+    def pop(self, name, default=_missing):
+        value = self.get(name, _missing)
+        if value is _missing:
+            if default is _missing:
+                raise KeyError(name)
+            return default
+        del self[name]
+        return value
+
+    def setdefault(self, name, default=None):
+        value = self.get(name, _missing)
+        if value is _missing:
+            self[name] = value = default
+        return value
+
+    def update(self, headers):
+        """Replace the values of the headers given, all of them if repeated."""
+        self._parse().update(Headers(headers)._values)
+
+    def _joined_values(self):
+        joined = self._joined
+        if joined is None:
+            joined = self._join()
+        return joined
+
+    def keys(self):
+        return self._joined_values().keys()
+
+    def __iter__(self):
+        return iter(self._joined_values())
+
+    iterkeys = __iter__
+
+    def __len__(self):
+        return len(self._joined_values())
+
+    def iteritems(self):
+        return self._joined_values().iteritems()
+
+    def items(self):
+        return self._joined_values().items()
+
+    def values(self):
+        return self._joined_values().values()
+
+    def multi_items(self):
+        """Return the (name, value) pairs with one for every value of a
+        repeated header."""
+        if self._values is None:
+            return _split_lines(self._raw)
+        return [(name, value) for name, values in self._values.iteritems()
+                for value in values]
+
+    def copy(self):
+        return Headers(self)
+
+    def __eq__(self, other):
+        if isinstance(other, Headers):
+            other = other._joined_values()
+        return self._joined_values() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return Headers, (self.multi_items(),)
+
+    def __repr__(self):
+        return repr(self._joined_values())
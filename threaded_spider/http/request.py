@@ -1,90 +1,135 @@
-# -*- coding: utf-8 -*-
-"""
-This module implements the Request class which is
-used to represent a request object in this project.
-"""
-
-from .common import obsolete_setter
-
-class Request(object):
-    # Attributes of body and url must be type of str, or else, will raise UnicodeEncodeError 
-    # when recording an object containg Request formated by `%s` to the log file.
-    # such as follows(`ascii` is the default system encoding):
-    #     >>> z
-    #     u'123 \u65e5\u5b98\u65b910\u4f73\u7403'
-    #     >>> z.encode()
-    #     Traceback (most recent call last):
-    #      File "<stdin>", line 1, in <module>
-    #     UnicodeEncodeError: 'ascii' codec can't encode characters in position 4-6: 
-    #     ordinal not in range(128)
-    #     >>> z.encode('gbk')
-    #     '123 \xc8\xd5\xb9\xd9\xb7\xbd10\xbc\xd1\xc7\xf2'
-    #     >>> print z.encode('gbk')
-    #     123 日官方10佳球
-
-    ATTRS = ['url', 'method', 'headers', 'body', 'calback',
-             'depth', 'encoding']
-    
-    def __init__(self, url, callback=None, method='GET',
-                 headers=None, body=None, depth=1, encoding='utf-8'):
-        self._encoding = encoding
-        self.method = str(method).upper()
-        self._set_url(url)
-        self._set_body(body)
-        self.headers = headers or {}
-        self.callback = callback
-        self.depth = depth
-    
-    def _get_url(self):
-        return self._url
-    
-    def _set_url(self, url):
-        if isinstance(url, unicode):
-            self._set_url(url.encode(self.encoding))
-        elif isinstance(url, str):
-            self._url = url
-        else:
-            raise TypeError('Request url must be unicode or str, got %s' % type(url).__name__)
-            
-        if ':' not in self._url:
-            raise ValueError('Missing scheme in request url: %s' % self._url)   
-    
-    url = property(_get_url, obsolete_setter(_set_url, 'url'))
-    
-    def _get_body(self):
-        return self._body
-    
-    def _set_body(self, body):
-        if isinstance(body, unicode):
-            self._body = self._set_body(body.encode(self.encoding))
-        elif isinstance(body, str):
-            self._body = body
-        elif body is None:
-            self._body = ''
-        else:
-            raise TypeError('Request body must be unicode or str, got %s' % type(body).__name__)
-    
-    body = property(_get_body, obsolete_setter(_set_body, 'body'))
-    
-    @property
-    def encoding(self):
-        return self._encoding
-    
-    def __str__(self):
-        return "<%s %s>" % (self.method, self.url)
-    
-    __repr__ = __str__
-    
-    def copy(self):
-        """return a copy of this request"""
-        return self.replace()
-    
-    def replace(self, *args, **kws):
-        """
-        Create a new Request object with the same attributes 
-        except for those given new values.
-        """
-        for x in self.ATTRS:
-            kws.setdefault(x, getattr(self, x))
-        cls = self.__class__
+# -*- coding: utf-8 -*-
+"""
+This module implements the Request class which is
+used to represent a request object in this project.
+"""
+
+from .common import obsolete_setter, fingerprint
+
+class Request(object):
+    # Attributes of body and url must be type of str, or else, will raise UnicodeEncodeError 
+    # when recording an object containg Request formated by `%s` to the log file.
+    # such as follows(`ascii` is the default system encoding):
+    #     >>> z
+    #     u'123 \u65e5\u5b98\u65b910\u4f73\u7403'
+    #     >>> z.encode()
+    #     Traceback (most recent call last):
+    #      File "<stdin>", line 1, in <module>
+    #     UnicodeEncodeError: 'ascii' codec can't encode characters in position 4-6: 
+    #     ordinal not in range(128)
+    #     >>> z.encode('gbk')
+    #     '123 \xc8\xd5\xb9\xd9\xb7\xbd10\xbc\xd1\xc7\xf2'
+    #     >>> print z.encode('gbk')
+    #     123 日官方10佳球
+
+    ATTRS = ['url', 'method', 'headers', 'body', 'callback',
+             'depth', 'encoding', 'meta']
+    # The attributes replaced without the constructor, which validates the
+    # others and rejects the unknown ones.
+    TRUSTED_ATTRS = frozenset(['callback', 'headers', 'depth', 'meta'])
+    
+    # No instance dict, millions of requests may wait in the scheduler.
+    __slots__ = ('_url', '_body', '_encoding', '_fingerprint', 'method', 'headers',
+                 'callback', 'depth', 'meta')
+    
+    # `meta` holds the options of the request for the downloader and
+    # scheduler, such as download_timeout, connect_timeout, retry_times,
+    # dont_retry and not_before.
+    def __init__(self, url, callback=None, method='GET',
+                 headers=None, body=None, depth=1, encoding='utf-8', meta=None):
+        self._encoding = encoding
+        self.method = str(method).upper()
+        self._set_url(url)
+        self._set_body(body)
+        self.headers = headers or {}
+        self.callback = callback
+        self.depth = depth
+        self.meta = dict(meta) if meta else {}
+        self._fingerprint = fingerprint(self.method, self._url, self._body)
+    
+    @classmethod
+    def _from_trusted(cls, url, callback=None, method='GET', headers=None, body='',
+                      depth=1, encoding='utf-8', meta=None, fp=None):
+        """Create a request without the checks of the constructor, for the
+        internal callers whose url and body are str and method is upper
+        case already. The headers and meta dicts are taken, not copied."""
+        self = object.__new__(cls)
+        self._url = url
+        self._body = body
+        self._encoding = encoding
+        self._fingerprint = fp or fingerprint(method, url, body)
+        self.method = method
+        self.headers = {} if headers is None else headers
+        self.callback = callback
+        self.depth = depth
+        self.meta = {} if meta is None else meta
+        return self
+    
+    def _get_url(self):
+        return self._url
+    
+    def _set_url(self, url):
+        if isinstance(url, unicode):
+            self._set_url(url.encode(self.encoding))
+        elif isinstance(url, str):
+            self._url = url
+        else:
+            raise TypeError('Request url must be unicode or str, got %s' % type(url).__name__)
+            
+        if ':' not in self._url:
+            raise ValueError('Missing scheme in request url: %s' % self._url)   
+    
+    url = property(_get_url, obsolete_setter(_set_url, 'url'))
+    
+    def _get_body(self):
+        return self._body
+    
+    def _set_body(self, body):
+        if isinstance(body, unicode):
+            self._set_body(body.encode(self.encoding))
+        elif isinstance(body, str):
+            self._body = body
+        elif body is None:
+            self._body = ''
+        else:
+            raise TypeError('Request body must be unicode or str, got %s' % type(body).__name__)
+    
+    body = property(_get_body, obsolete_setter(_set_body, 'body'))
+    
+    @property
+    def encoding(self):
+        return self._encoding
+    
+    @property
+    def fingerprint(self):
+        """The hex digest of the method, canonical url and body, which
+        identifies the request for the dupefilter, caches and sharding."""
+        return self._fingerprint
+    
+    def __str__(self):
+        return "<%s %s>" % (self.method, self.url)
+    
+    __repr__ = __str__
+    
+    def copy(self):
+        """return a copy of this request"""
+        return self.replace()
+    
+    def replace(self, *args, **kws):
+        """
+        Create a new Request object with the same attributes 
+        except for those given new values.
+        """
+        cls = self.__class__
+        if not args and self.TRUSTED_ATTRS.issuperset(kws) and \
+                cls.__init__ == Request.__init__:
+            # Nothing to check again.
+            meta = kws.get('meta', self.meta)
+            return cls._from_trusted(self._url, kws.get('callback', self.callback),
+                                     self.method, kws.get('headers', self.headers) or {},
+                                     self._body, kws.get('depth', self.depth),
+                                     self._encoding, dict(meta) if meta else {},
+                                     self._fingerprint)
+        for x in self.ATTRS:
+            kws.setdefault(x, getattr(self, x))
         return cls(*args, **kws)
\ No newline at end of file
@@ -1,73 +1,136 @@
-"""This module implements the Response class which is used 
-to represent a response object in this project"""
-
-from .common import obsolete_setter
-
-class Response(object):
-    
-    ATTRS = ['url', 'status', 'body', 'headers', 'request',
-             'encoding']
-    
-    def __init__(self, url, status=200, headers=None,
-                 body=None, request=None, encoding='utf-8'):
-        self._encoding = encoding
-        self.headers = headers or {}
-        self.status = int(status)
-        self._set_url(url)
-        self._set_body(body)
-        self.request = request
-     
-    @property
-    def encoding(self):
-        return self._encoding
-        
-    def _get_url(self):
-        return self._url
-    
-    def _set_url(self, url):
-        if isinstance(url, unicode):
-            self._set_url(url.encode(self.encoding))
-        elif isinstance(url, str):
-            self._url = url
-        else:
-            raise TypeError('%s url must be str or unicode, got %s' 
-                            % (type(self).__name__, type(url).__name__))
-        
-        if ':' not in self._url:
-            raise ValueError('Missing scheme in Response url: %s', self._url)
-    
-    url = property(_get_url, obsolete_setter(_set_url, 'url'))
-    
-    def _get_body(self):
-        return self._body
-    
-    def _set_body(self, body):
-        if isinstance(body, unicode):
-            self._body = self._set_body(body.encode(self.encoding))
-        elif isinstance(body, str):
-            self._body = body
-        elif body is None:
-            self._body = ''
-        else:
-            raise TypeError('Response body must be unicode or str, got %s' % type(body).__name__)
-    
-            
-    body = property(_get_body, obsolete_setter(_set_body, 'body'))
-    
-    def __str__(self):
-        return '<%d %s>' % (self.status, self.url)
-    
-    __repr__ = __str__
-    
-    def copy(self):
-        """Create a copy of this response."""
-        return self.replace()
-    
-    def replace(self, *args, **kws):
-        """Create a new response with the same attributes
-        except for the given new values"""
-        for x in self.ATTRS:
-            kws.setdefault(x, getattr(self, x))
-        cls = self.__class__
-        return cls(*args, **kws)
+"""This module implements the Response class which is used 
+to represent a response object in this project"""
+import mmap
+
+from .common import obsolete_setter
+from .charset import detect_encoding
+from .headers import Headers
+
+class Response(object):
+    
+    ATTRS = ['url', 'status', 'body', 'headers', 'request',
+             'encoding']
+    # The attributes replaced without the constructor, which validates the
+    # others and rejects the unknown ones.
+    TRUSTED_ATTRS = frozenset(['status', 'request'])
+    
+    # `_text` and `_detected` are the decoded body and the (encoding, BOM length)
+    # detected, computed when first needed.
+    __slots__ = ('_url', '_body', '_encoding', '_text', '_detected', 'status',
+                 'headers', 'request')
+    
+    # `encoding` overrides the one detected from the body and headers.
+    def __init__(self, url, status=200, headers=None,
+                 body=None, request=None, encoding=None):
+        self._encoding = encoding
+        self._text = self._detected = None
+        self.headers = headers if isinstance(headers, Headers) else Headers(headers)
+        self.status = int(status)
+        self._set_url(url)
+        self._set_body(body)
+        self.request = request
+    
+    @classmethod
+    def _from_trusted(cls, url, status=200, headers=None, body='', request=None,
+                      encoding=None):
+        """Create a response without the checks of the constructor, for the
+        downloaders whose url is a str, status an int, headers a Headers and
+        body a str, bytearray or mmap."""
+        self = object.__new__(cls)
+        self._url = url
+        self._body = body
+        self._encoding = encoding
+        self._text = self._detected = None
+        self.status = status
+        self.headers = Headers() if headers is None else headers
+        self.request = request
+        return self
+    
+    def _detect(self):
+        if self._detected is None:
+            self._detected = detect_encoding(self.headers.get('content-type'), self._body)
+        return self._detected
+    
+    @property
+    def encoding(self):
+        """The encoding given to the constructor, or else the one detected
+        from a BOM, the Content-Type header, a <meta> tag or the body."""
+        return self._encoding or self._detect()[0]
+    
+    @property
+    def text(self):
+        """The body decoded once and shared by all the consumers, the
+        undecodable bytes replaced."""
+        if self._text is None:
+            if self._encoding:
+                encoding, bom_length = self._encoding, 0
+            else:
+                encoding, bom_length = self._detect()
+            body = self._body
+            if bom_length or isinstance(body, mmap.mmap):
+                # An mmap has no decode().
+                body = body[bom_length:]
+            self._text = body.decode(encoding, 'replace')
+        return self._text
+        
+    def _get_url(self):
+        return self._url
+    
+    def _set_url(self, url):
+        if isinstance(url, unicode):
+            self._set_url(url.encode(self._encoding or 'utf-8'))
+        elif isinstance(url, str):
+            self._url = url
+        else:
+            raise TypeError('%s url must be str or unicode, got %s' 
+                            % (type(self).__name__, type(url).__name__))
+        
+        if ':' not in self._url:
+            raise ValueError('Missing scheme in Response url: %s', self._url)
+    
+    url = property(_get_url, obsolete_setter(_set_url, 'url'))
+    
+    def _get_body(self):
+        return self._body
+    
+    def _set_body(self, body):
+        if isinstance(body, unicode):
+            self._set_body(body.encode(self._encoding or 'utf-8'))
+        elif isinstance(body, (str, bytearray, mmap.mmap)):
+            # A large body preallocated by the downloader is a bytearray,
+            # one spilled to a file an mmap.
+            self._body = body
+        elif body is None:
+            self._body = ''
+        else:
+            raise TypeError('Response body must be unicode, str, bytearray or mmap, got %s'
+                            % type(body).__name__)
+    
+            
+    body = property(_get_body, obsolete_setter(_set_body, 'body'))
+    
+    def __str__(self):
+        return '<%d %s>' % (self.status, self.url)
+    
+    __repr__ = __str__
+    
+    def copy(self):
+        """Create a copy of this response."""
+        return self.replace()
+    
+    def replace(self, *args, **kws):
+        """Create a new response with the same attributes
+        except for the given new values"""
+        cls = self.__class__
+        if not args and self.TRUSTED_ATTRS.issuperset(kws) and \
+                cls.__init__ == Response.__init__:
+            # Nothing to check again.
+            return cls._from_trusted(self._url, int(kws.get('status', self.status)),
+                                     self.headers, self._body,
+                                     kws.get('request', self.request), self._encoding)
+        # Not the detected one, a new body is detected again.
+        kws.setdefault('encoding', self._encoding)
+        for x in self.ATTRS:
+            kws.setdefault(x, getattr(self, x))
+        return cls(*args, **kws)
     
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Canonicalize the urls, so that the spellings of a page such as
+`HTTP://Example.com:80/a/../b?y=2&x=1#top` and `http://example.com/b?x=1&y=2`
+are fetched and fingerprinted once.
+
+The results are kept in LRU caches, the same navigation links are joined
+on every page of a site and the duplicated requests are fingerprinted
+again and again.
+"""
+from __future__ import with_statement
+
+import re
+import urllib
+import urlparse
+import threading
+from collections import OrderedDict
+
+# Entries kept by each of the caches.
+URL_CACHE_SIZE = 10000
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Schemes of the links worth following.
+FOLLOWED_SCHEMES = frozenset(['http', 'https'])
+# Characters left as is when quoting, with `%` so that the escapes stay.
+_PATH_SAFE = "%/;:@&=+$,!~*'()"
+_QUERY_SAFE = "%/;:@&=+$,!~*'()?"
+_SCHEME_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+_missing = object()
+
+def _lru_cached(maxsize):
+    """Cache the results of a function of hashable arguments, dropping
+    the least recently used ones beyond `maxsize`."""
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        def wrapper(*args):
+            with lock:
+                value = cache.pop(args, _missing)
+                if value is not _missing:
+                    # Back at the end as the most recently used one.
+                    cache[args] = value
+                    return value
+            value = func(*args)
+            with lock:
+                cache[args] = value
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+def _remove_dot_segments(path):
+    if '.' not in path:
+        return path
+    segments = []
+    for segment in path.split('/'):
+        if segment == '..':
+            # Keep the empty segment before the leading slash.
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != '.':
+            segments.append(segment)
+    if path.endswith(('/.', '/..')):
+        segments.append('')
+    return '/'.join(segments) or '/'
+
+def _canonical_netloc(scheme, netloc):
+    userinfo, at, hostport = netloc.rpartition('@')
+    hostport = hostport.lower()
+    host, colon, port = hostport.rpartition(':')
+    # Not a port but a part of an IPv6 address.
+    if colon and ']' not in port and (not port or port == str(DEFAULT_PORTS.get(scheme))):
+        hostport = host
+    return userinfo + at + hostport
+
+@_lru_cached(URL_CACHE_SIZE)
+def canonicalize_url(url):
+    """
+    Return the canonical form of an absolute url: the scheme and host
+    lowercased, the default port and the fragment dropped, the dot segments
+    of the path resolved, the query arguments sorted by name and the unsafe
+    characters percent-encoded.
+    """
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url.strip())
+    scheme = scheme.lower()
+    netloc = _canonical_netloc(scheme, netloc)
+    path = urllib.quote(_remove_dot_segments(path), _PATH_SAFE) or '/'
+    if query:
+        # Stable, the values of a repeated argument keep their order.
+        arguments = sorted((arg for arg in query.split('&') if arg),
+                           key=lambda arg: arg.partition('=')[0])
+        query = urllib.quote('&'.join(arguments), _QUERY_SAFE)
+    return urlparse.urlunsplit((scheme, netloc, path, query, ''))
+
+@_lru_cached(URL_CACHE_SIZE)
+def _join_url(base_url, href):
+    url = urlparse.urljoin(base_url, href)
+    parts = urlparse.urlsplit(url)
+    if parts.scheme.lower() not in FOLLOWED_SCHEMES or not parts.netloc:
+        return None
+    return canonicalize_url(url)
+
+def join_url(base_url, href):
+    """
+    Return the canonical absolute url of a link found in the page of
+    `base_url`, or None if it isn't a http(s) url with a host or points into
+    the page itself, such as `javascript:` and `#top`.
+    """
+    if isinstance(href, unicode):
+        href = href.encode('utf-8')
+    href = href.strip()
+    if not href or href.startswith('#'):
+        return None
+    # Key the cache by as little of the base url as the result depends on,
+    # so that the links repeated on every page are joined once.
+    match = _SCHEME_RE.match(href)
+    if match:
+        scheme = href[:match.end()].lower()
+        # Joined unless absolute or of another scheme, `http:foo` is
+        # relative to a http page.
+        if href.startswith('//', match.end()) or \
+                not base_url.lower().startswith(scheme):
+            base_url = None
+    elif href.startswith('/'):
+        end = base_url.find('/', base_url.find('//') + 2)
+        if end > 0:
+            base_url = base_url[:end]
+    return _join_url(base_url, href)
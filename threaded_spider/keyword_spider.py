@@ -1,69 +1,80 @@
-"""Customize a spider for search the web pages whose text contains the specific
-key words.
-"""
-import BeautifulSoup  
-
-from threaded_spider.http import Request
-from threaded_spider.core.spider import BaseSpider
-from threaded_spider.basic.util import unicode_to_str, make_utf8
-from threaded_spider.keyword_item import Item
-
-class KeyWordSpider(BaseSpider):
-    """Search key words in a html document"""
-    
-    def __init__(self, name, start_urls=[]):
-        super(KeyWordSpider, self).__init__(name, start_urls=start_urls)
-     
-     
-    def extract_links(self, html_url, html_content):
-        def canonicalize_href(base_url, href):
-            if not href:
-                return
-            
-            if href.startswith('http://'):
-                return href
-            elif href.startswith('/'):
-                return base_url + href
-            elif href.find('javascript') != -1:
-                return
-            else:
-                return base_url + '/' + href
-          
-        soup = BeautifulSoup.BeautifulSoup(html_content)
-        hrefs = set() 
-        for link_info in soup.fetch('a'):  
-            href = unicode_to_str(link_info.get('href', None))
-            href = canonicalize_href(html_url, href)
-            if not href or href in hrefs:
-                    continue
-            else:
-                yield href
-                hrefs.add(href)           
-    
-    def need_detatch(self):
-        return self.crawler.stopped
-    
-    def parse(self, response):
-        html_url = response.url
-        html_content = unicode_to_str(response.body)
-        depth = response.request.depth
-        
-        if -1 == html_content.find('</'):
-            self.log('%s html has invalid header: %r', response, html_content[:200],
-                     log_level='WARN')
-            return
-        
-        if self.crawler.settings.get('MAX_DEPTH', 0) == 0:
-            pass
-        elif depth >= self.crawler.settings.get('MAX_DEPTH', 0):
-            pass
-        else: 
-            for link in self.extract_links(html_url, html_content):
-                print 'Schedule link: %r' % link
-                yield Request(url=link, depth=depth + 1)
-        
-        item = Item()
-        item['html_content'] = html_content
-        item['depth'] = depth 
-        item['self_url'] = html_url   
+"""Customize a spider for search the web pages whose text contains the specific
+key words.
+"""
+import BeautifulSoup  
+
+from threaded_spider.http import Request
+from threaded_spider.http.url import join_url
+from threaded_spider.core.spider import BaseSpider
+from threaded_spider.basic.util import unicode_to_str, make_utf8
+from threaded_spider.keyword_item import Item
+
+class KeyWordSpider(BaseSpider):
+    """Search key words in a html document"""
+    
+    # Only the html documents are downloaded.
+    allowed_content_types = ['text/html', 'application/xhtml+xml']
+    ignored_extensions = [
+        # images
+        'jpg', 'jpeg', 'png', 'gif', 'bmp', 'ico', 'svg', 'webp', 'tif', 'tiff',
+        # audio and video
+        'mp3', 'wav', 'ogg', 'wma', 'mp4', 'avi', 'mov', 'mpg', 'mpeg', 'wmv',
+        'flv', 'swf', 'webm', 'm4a', 'm4v',
+        # documents
+        'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'odt', 'ods', 'rtf',
+        # archives and binaries
+        'zip', 'rar', 'gz', 'tgz', 'bz2', '7z', 'tar', 'exe', 'msi', 'dmg',
+        'apk', 'iso', 'bin', 'deb', 'rpm',
+        # others
+        'css', 'js',
+    ]
+    
+    def __init__(self, name, start_urls=[]):
+        super(KeyWordSpider, self).__init__(name, start_urls=start_urls)
+     
+     
+    def extract_links(self, html_url, html_content):
+        soup = BeautifulSoup.BeautifulSoup(html_content)
+        hrefs = set() 
+        for link_info in soup.fetch('a'):  
+            href = unicode_to_str(link_info.get('href', None))
+            # Relative, `//host` and `../` links are resolved against the
+            # page url, the others than http(s) are skipped.
+            href = href and join_url(html_url, href)
+            if not href or href in hrefs:
+                    continue
+            else:
+                yield href
+                hrefs.add(href)           
+    
+    def need_detatch(self):
+        return self.crawler.stopped
+    
+    def parse(self, response):
+        html_url = response.url
+        # A large body is a bytearray or an mmap, scanned in place and stored
+        # as is, only the link extraction decodes it.
+        html_content = response.body
+        depth = response.request.depth
+        
+        if -1 == html_content.find('</'):
+            self.log('%s html has invalid header: %r', response, html_content[:200],
+                     log_level='WARN')
+            return
+        
+        if self.crawler.settings.get('MAX_DEPTH', 0) == 0:
+            pass
+        elif depth >= self.crawler.settings.get('MAX_DEPTH', 0):
+            pass
+        else: 
+            # Decoded once by the detected charset, which spares BeautifulSoup
+            # guessing it by decoding the whole page again and again.
+            for link in self.extract_links(html_url, response.text):
+                print 'Schedule link: %r' % link
+                yield Request(url=link, depth=depth + 1)
+        
+        item = Item()
+        item['html_content'] = html_content
+        item['depth'] = depth 
+        item['self_url'] = html_url   
         yield item
\ No newline at end of file
@@ -32,6 +32,9 @@ level_pairs_reverse = [(v, k) for k, v in level_pairs]
 level_pairs.extend(level_pairs_reverse) 
 level_map = dict([(k, v) for k, v in level_pairs])
 
+# The observer installed by `start`, whose level can be changed at runtime.
+_log_observer = None
+
 
 class FobjBasedOnLogging(object):
     def __init__(self, file_path, enable_console_output=True):
@@ -207,6 +210,8 @@ def start(log_file=None, log_level='INFO', enable_console_output=True,
         delivered to log observers instead of the stdout or stderr.
     """
     
+    global _log_observer
+    
     log_level = _get_log_level_id(log_level)
     log_observer = CrawlerLogObserver(log_file, log_level=log_level,
                                       log_encoding=log_encoding,
@@ -214,8 +219,22 @@ def start(log_file=None, log_level='INFO', enable_console_output=True,
                                       crawler=crawler) 
     log.startLoggingWithObserver(log_observer.emit, 
                                  setStdout=redirect_stdout_to_logfile) 
+    _log_observer = log_observer
     return log_observer
 
+def set_level(log_level):
+    """Change the minimum level being logged by the observer installed
+    by `start`, it takes effect for the next log statement."""
+    if _log_observer is None:
+        raise ValueError('Logging not started.')
+    if isinstance(log_level, basestring):
+        # Not NOISY for a misspelled name such as 'warning'.
+        if log_level.upper() not in level_map:
+            raise ValueError('Unknown log level: %r, expected one of %s'
+                             % (log_level, ', '.join(name for name, _ in level_pairs_reverse)))
+        log_level = log_level.upper()
+    _log_observer.level = _get_log_level_id(log_level)
+
 def _log(message=None, **kw):
     kw.setdefault('system', 'crawler')
     if message is None:
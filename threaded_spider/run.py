@@ -39,6 +39,15 @@ def main():
     parser.add_option('-l', dest='log_level', default=4,
                       type='choice', choices=['1', '2', '3', '4', '5'],
                       help='Log level, the larger the numerical value the more verbose the log info.')
+    parser.add_option('--control', dest='control_file', default=None,
+                      help='JSON file to reconfigure the running crawler, reloaded on '
+                           'modification or SIGUSR1, disabled by default.')
+    parser.add_option('--checkpoint', dest='checkpoint_fp', default=None,
+                      help='File to save the unfinished requests to when the crawler is '
+                           'stopped by the memory watchdog, disabled by default.')
+    parser.add_option('--resume', dest='resume', default=False,
+                      action='store_true',
+                      help='Resume the crawl from the requests saved in the checkpoint file.')
     parser.add_option('--test', dest='test_mode', default=False,
                       action='store_true',
                       help='Run in test mode to do unit tests')
@@ -61,12 +70,18 @@ def main():
     _s = Settings(values={'MAX_DEPTH': opts.max_depth, 'LOG_LEVEL': opts.log_level,
                           'THREAD_NUM': opts.thread_num,
                           'ITEM_PROCESSOR': 'threaded_spider.keyword_itemproc.DBStore',
-                          'DB_FP': opts.db_fp, 'DB_SCHEMA': DB_SCHEMA,}
+                          'DB_FP': opts.db_fp, 'DB_SCHEMA': DB_SCHEMA,
+                          'CONTROL_FILE': opts.control_file,
+                          'CHECKPOINT_FILE': opts.checkpoint_fp,}
                   )
     spider = KeyWordSpider('spider.sina', start_urls=[opts.start_url])
     crawler = Crawler(_s) 
     print '@main, crawler settings: %s' % crawler.settings   
-    crawler.attach_spider(spider)
+    if opts.resume and opts.checkpoint_fp and os.path.exists(opts.checkpoint_fp):
+        from threaded_spider.core.checkpoint import load_requests
+        crawler.attach_spider(spider, requests=load_requests(opts.checkpoint_fp, spider))
+    else:
+        crawler.attach_spider(spider)
     crawler.prepare_engine()
     crawler.crawl()
     